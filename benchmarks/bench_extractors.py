@@ -0,0 +1,109 @@
+"""Micro-benchmark of the TextExtractor backends.
+
+Compares throughput (MB/s of html) and output size of every available backend, with and without main content
+mode, on html files given on the command line or on a synthetic page with the usual boilerplate.
+
+    python benchmarks/bench_extractors.py [--repeat 20] [page.html ...]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osi.src.TextExtractor import TextExtractor
+
+
+def synthetic_page(n_paragraphs=400):
+    """A heavy page: scripts, navigation, cookie banner, article paragraphs with links, related links, footer"""
+    sentence = "The quick brown fox jumps over the lazy dog while the committee reviews the quarterly results. "
+    parts = ["<html><head><title>Article</title>", "<script>" + "var x = 1;" * 2000 + "</script>",
+             "<style>" + "p { color: red; }" * 500 + "</style></head><body>",
+             "<div class='cookie-banner'><p>We use cookies to improve your experience. Accept all cookies?</p></div>",
+             "<nav><ul>" + "".join(f"<li><a href='/s{i}'>Section {i}</a></li>" for i in range(50)) + "</ul></nav>",
+             "<main><article>"]
+    for i in range(n_paragraphs):
+        parts.append(f"<p>{sentence * 3}<a href='/ref{i}'>reference {i}</a> &amp; more.</p>")
+        if i % 20 == 0:
+            parts.append("<div class='share-buttons'><p>Share on social media and subscribe now</p></div>")
+    parts.append("</article></main>")
+    parts.append("<div class='related'>" + "".join(f"<p><a href='/r{i}'>Related story number {i} you may like</a></p>" for i in range(30)) + "</div>")
+    parts.append("<footer><p>Copyright 2024 Example Corp. All rights reserved. Terms and privacy policy.</p></footer></body></html>")
+    return "".join(parts)
+
+
+def available_backends():
+    backends = []
+    for backend in TextExtractor.BACKENDS:
+        try:
+            TextExtractor(backend=backend).extract("<p>probe</p>")
+            backends.append(backend)
+        except ImportError:
+            print(f"Skipping {backend}: not installed")
+    return backends
+
+
+# wrappers seen on real sites whose class names merely mention boilerplate
+WRAPPER_PAGES = [
+    "<body class='no-sidebar'><p>{text}</p></body>",
+    "<body class='home page has-main-navigation'><div id='content'><p>{text}</p></div></body>",
+    "<html class='menu-open'><body><div class='ad-free'><p>{text}</p></div></body></html>",
+    "<body><div class='site-wrapper sidebar-left'><main class='main nav-collapsed'><p>{text}</p></main></div></body>",
+    # everything looks like boilerplate, the plain paragraph text is returned
+    "<body><div class='sidebar'><p>{text}</p></div></body>",
+]
+
+
+def check_main_content(backends):
+    """Assert that main content mode keeps the article text of every WRAPPER_PAGES page on every backend"""
+    text = "The committee reviewed the quarterly results of the renewable energy program."
+    for backend in backends:
+        extractor = TextExtractor(backend=backend, main_content=True)
+        for page in WRAPPER_PAGES:
+            extracted = extractor.extract(page.format(text=text))
+            assert extracted == text, f"{backend} extracted {extracted!r} from {page!r}"
+
+
+def benchmark(pages, repeat):
+    total_bytes = sum(len(page.encode("utf-8")) for page in pages)
+    results = []
+    for backend in available_backends():
+        for main_content in (False, True):
+            extractor = TextExtractor(backend=backend, main_content=main_content)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                texts = [extractor.extract(page) for page in pages]
+            elapsed = time.perf_counter() - start
+            results.append({
+                "backend": backend,
+                "main_content": main_content,
+                "mb_per_s": total_bytes * repeat / elapsed / 1e6,
+                "pages_per_s": len(pages) * repeat / elapsed,
+                "output_chars": sum(len(text) for text in texts),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="html files, a synthetic page if none")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.files:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages.append(f.read())
+    pages = pages or [synthetic_page()]
+    check_main_content(available_backends())
+    print(f"{len(pages)} page(s), {sum(len(page) for page in pages) / 1e3:.0f}k chars, {args.repeat} repeats")
+
+    print(f"{'backend':<12} {'main':<6} {'MB/s':>8} {'pages/s':>9} {'chars':>9}")
+    for result in benchmark(pages, args.repeat):
+        print(f"{result['backend']:<12} {str(result['main_content']):<6} {result['mb_per_s']:>8.1f} "
+              f"{result['pages_per_s']:>9.1f} {result['output_chars']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Scaling benchmark of html parsing on threads versus the process pool.
+
+Simulates the scraping workload of the Orchestrator: fetch threads wait on the network (a sleep of --latency
+seconds) and then extract the page text, either in the fetching thread or on a ParsePool of 1, 2, 4, ... up to
+the number of CPUs processes. The bs4 backend is the default since it is the most CPU-heavy.
+
+    python benchmarks/bench_parse_pool.py [--pages 200] [--threads 32] [--backend bs4] [page.html ...]
+"""
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osi.src.ParsePool import ParsePool
+from osi.src.TextExtractor import TextExtractor
+from bench_extractors import synthetic_page
+
+
+def run(pages, n_threads, latency, extractor, pool=None):
+    """Fetch and parse every page, return pages per second"""
+    def fetch_and_parse(content):
+        time.sleep(latency)
+        if pool is None:
+            return extractor.extract(content.decode("utf-8"))
+        return pool.extract(content, "utf-8", extractor)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+        texts = list(executor.map(fetch_and_parse, pages))
+    elapsed = time.perf_counter() - start
+    assert all(texts)
+    return len(pages) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="html files, a synthetic page if none")
+    parser.add_argument("--pages", type=int, default=200, help="number of pages processed per configuration")
+    parser.add_argument("--threads", type=int, default=32, help="number of fetching threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated download time in seconds")
+    parser.add_argument("--backend", default="bs4", choices=list(TextExtractor.BACKENDS))
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    documents = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            documents.append(f.read())
+    documents = documents or [synthetic_page().encode("utf-8")]
+    pages = [documents[i % len(documents)] for i in range(args.pages)]
+    extractor = TextExtractor(backend=args.backend, main_content=True)
+
+    print(f"{args.pages} pages, {args.threads} threads, {args.latency * 1000:.0f} ms latency, backend {args.backend}")
+    baseline = run(pages, args.threads, args.latency, extractor)
+    print(f"{'mode':<14} {'pages/s':>9} {'speedup':>8}")
+    print(f"{'threads':<14} {baseline:>9.1f} {1.0:>8.2f}")
+
+    n_processes = 1
+    while n_processes <= args.max_processes:
+        pool = ParsePool(max_workers=n_processes)
+        try:
+            # start the processes before timing, spawning is a one-off cost
+            concurrent.futures.wait([pool.submit(documents[0], "utf-8", extractor) for _ in range(n_processes)])
+            throughput = run(pages, args.threads, args.latency, extractor, pool=pool)
+        finally:
+            pool.shutdown()
+        print(f"{f'processes={n_processes}':<14} {throughput:>9.1f} {throughput / baseline:>8.2f}")
+        n_processes *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""End-to-end benchmark of the research pipeline against local stand-ins, no API key or network needed.
+
+Starts the fake OpenAI, Bing and fixture web server of standins.py and runs Orchestrator.perform_research (mode
+"research") and Worker.perform_task (mode "task") for every worker count. Per run it reports the wall time, topics
+per hour, latency percentiles of every pipeline stage, LLM calls and tokens per topic, bytes fetched and the server
+side counters (injected errors, 429s, aborted downloads). The results are written as JSON; pass a previous result
+file as --baseline to print the change of the wall times.
+
+    python benchmarks/bench_research.py [--workers 1,2,4,8] [--topics 4] [--llm-latency 0.2] [--error-rate 0.02]
+                                        [--rate-limit-rate 0.02] [--output results.json] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standins import StandIns, Corpus
+
+TOPICS = (
+    "Market trends of home battery storage in Europe",
+    "Adoption of solar energy by small businesses",
+    "Competition between electric vehicle charging networks",
+    "Regulation of energy prices in America",
+    "Investment in grid scale storage startups",
+    "Consumer demand for heat pumps",
+    "Efficiency gains of offshore wind capacity",
+    "Supply risks of lithium for battery makers",
+)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_rate_limiter(args):
+    """Start every run with a fresh process-wide limiter, a previous run's 429s would slow it down"""
+    from osi.src.RateLimiter import RateLimiter
+    with RateLimiter._shared_lock:
+        RateLimiter._shared = RateLimiter(requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute)
+
+
+def run_summary(n_workers, topics, wall_time, results, standins, tracer):
+    """Collect the metrics of a run into a JSON-serializable dict"""
+    server = standins.stats()
+    spans = tracer.stats()
+    n_topics = len(topics)
+    return {
+        "workers": n_workers,
+        "topics": n_topics,
+        "wall_time": wall_time,
+        "topics_per_hour": n_topics / wall_time * 3600 if wall_time else None,
+        "results": results,
+        "failures": sum(1 for result in results if result["error"]),
+        "stages": tracer.latency.stats(),
+        "spans": spans,
+        "llm": {
+            "calls": server["chat_requests"],
+            "calls_per_topic": server["chat_requests"] / n_topics,
+            "calls_by_kind": server["calls_by_kind"],
+            "prompt_tokens": server["prompt_tokens"],
+            "completion_tokens": server["completion_tokens"],
+            "tokens_per_topic": (server["prompt_tokens"] + server["completion_tokens"]) / n_topics,
+            "errors_injected": server["chat_errors"],
+            "rate_limited": server["chat_rate_limited"],
+            "retries": sum(entry["retries"] for entry in spans.values()),
+        },
+        "web": {
+            "searches": server["search_requests"],
+            "page_requests": server["page_requests"],
+            "bytes_sent": server["page_bytes_sent"],
+            "bytes_fetched": spans.get("scrape", {}).get("bytes", 0),
+            "downloads_aborted": server["page_aborted"],
+        },
+    }
+
+
+def run_research(args, topics, n_workers, standins):
+    """Run Orchestrator.perform_research for every topic with n_workers workers"""
+    from osi.src.Orchestrator import Orchestrator
+    from osi.src.Tracer import Tracer
+
+    reset_rate_limiter(args)
+    standins.reset_stats()
+    tracer = Tracer(enabled=True)
+    orchestrator = Orchestrator(n_workers=n_workers, search_engine="bing", use_cache=False,
+                                parse_processes=args.parse_processes, tracer=tracer)
+    results = []
+    start = time.perf_counter()
+    for topic in topics:
+        topic_start = time.perf_counter()
+        error = None
+        try:
+            reports, report = orchestrator.perform_research(topic, task_timeout=args.task_timeout)
+        except Exception as e:
+            reports, report, error = {}, "", f"{type(e).__name__}: {e}"
+        results.append({"topic": topic, "wall_time": time.perf_counter() - topic_start, "reports": len(reports),
+                        "report_chars": len(report or ""), "error": error})
+    wall_time = time.perf_counter() - start
+    orchestrator.close()
+    if args.trace_dir:
+        tracer.export_chrome(os.path.join(args.trace_dir, f"research-{n_workers}.json"))
+    return run_summary(n_workers, topics, wall_time, results, standins, tracer)
+
+
+def run_tasks(args, topics, n_workers, standins):
+    """Run Worker.perform_task for n_tasks subtasks per topic on n_workers threads, one Worker per thread"""
+    from osi.src.Worker import Worker
+    from osi.src.WebScraper import WebScraper
+    from osi.src.OpenAICaller import OpenAICaller
+    from osi.src.Tracer import Tracer
+
+    reset_rate_limiter(args)
+    standins.reset_stats()
+    tracer = Tracer(enabled=True)
+    # like the Orchestrator, the workers share one caller and one scraper
+    scraper = WebScraper(engine="bing", tracer=tracer)
+    caller = OpenAICaller("gpt-3.5-turbo")
+    workers = [Worker(openai_caller=caller, scraper=scraper, tracer=tracer) for _ in range(n_workers)]
+    subtasks = [f"Research the {aspect} of {topic}" for topic in topics for aspect in ("market size", "key players", "outlook")[:args.n_tasks]]
+
+    def perform(i, subtask):
+        start = time.perf_counter()
+        error = None
+        try:
+            report = workers[i % n_workers].perform_task(subtask, timeout=args.task_timeout)
+        except Exception as e:
+            report, error = "", f"{type(e).__name__}: {e}"
+        return {"topic": subtask, "wall_time": time.perf_counter() - start, "reports": int(bool(report)),
+                "report_chars": len(report or ""), "error": error}
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(perform, range(len(subtasks)), subtasks))
+    wall_time = time.perf_counter() - start
+    if args.trace_dir:
+        tracer.export_chrome(os.path.join(args.trace_dir, f"task-{n_workers}.json"))
+    summary = run_summary(n_workers, subtasks, wall_time, results, standins, tracer)
+    # per topic means per subtask here
+    summary["tasks"] = summary.pop("topics")
+    summary["tasks_per_hour"] = summary.pop("topics_per_hour")
+    return summary
+
+
+def print_run(mode, run):
+    unit = "topics" if mode == "research" else "tasks"
+    llm, web = run["llm"], run["web"]
+    print(f"{mode:<9} {run['workers']:>7} {run['wall_time']:>8.2f} {run[unit + '_per_hour']:>10.0f} {llm['calls_per_topic']:>9.1f} "
+          f"{llm['tokens_per_topic']:>10.0f} {web['bytes_fetched'] / 1e6:>8.2f} {llm['errors_injected'] + llm['rate_limited']:>7} "
+          f"{run['failures']:>6}")
+
+
+def print_stages(run):
+    print(f"  {'stage':<24} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, stats in run["stages"].items():
+        print(f"  {stage:<24} {stats['count']:>6} {stats['p50'] * 1000:>8.0f} {stats['p95'] * 1000:>8.0f} {stats['p99'] * 1000:>8.0f}")
+
+
+def compare(results, baseline_path):
+    """Print the wall time of every run relative to the same run in a previous result file"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared to {baseline_path} ({baseline.get('revision')}):")
+    for mode in ("research", "task"):
+        previous = {run["workers"]: run for run in baseline.get(mode, [])}
+        for run in results.get(mode, []):
+            if run["workers"] in previous:
+                ratio = run["wall_time"] / previous[run["workers"]]["wall_time"]
+                tokens = run["llm"]["tokens_per_topic"] - previous[run["workers"]]["llm"]["tokens_per_topic"]
+                print(f"  {mode:<9} {run['workers']:>3} workers: wall time x{ratio:.2f}, tokens per topic {tokens:+.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("research", "task", "both"), default="both")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--topics", type=int, default=4, help="number of built-in topics per run")
+    parser.add_argument("--topics-file", help="file with one topic per line, replaces the built-in topics")
+    parser.add_argument("--n-tasks", type=int, default=3, help="subtasks per topic in task mode")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="mean seconds per completion")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="completion generation speed, 0 for instant")
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of completions failing with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds of a 429")
+    parser.add_argument("--requests-per-minute", type=int, default=100000, help="client side request budget")
+    parser.add_argument("--tokens-per-minute", type=int, default=100000000, help="client side token budget")
+    parser.add_argument("--parse-processes", type=int, default=None)
+    parser.add_argument("--task-timeout", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_research.json", help="result file")
+    parser.add_argument("--baseline", help="result file of a previous version to compare with")
+    parser.add_argument("--trace-dir", help="write a Chrome trace of every run into this directory")
+    parser.add_argument("--verbose", action="store_true", help="show the log output of the pipeline")
+    args = parser.parse_args()
+
+    if args.topics_file:
+        with open(args.topics_file, encoding="utf-8") as f:
+            topics = [line.strip() for line in f if line.strip()]
+    else:
+        topics = [TOPICS[i % len(TOPICS)] for i in range(args.topics)]
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    modes = ("research", "task") if args.mode == "both" else (args.mode,)
+    if args.trace_dir:
+        os.makedirs(args.trace_dir, exist_ok=True)
+
+    # nothing may be served from the caches of earlier runs
+    os.environ["OSI_CACHE_DIR"] = tempfile.mkdtemp(prefix="osi-bench-")
+    results = {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+               "platform": platform.platform(), "cpus": os.cpu_count(), "config": vars(args), "topics": topics}
+
+    with StandIns(llm_latency=args.llm_latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                  rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, search_latency=args.search_latency,
+                  page_latency=args.page_latency, corpus=Corpus(seed=args.seed), seed=args.seed) as standins:
+        standins.configure()
+        print(f"Stand-ins at {standins.url}, {len(topics)} topics, workers {worker_counts}")
+        print(f"{'mode':<9} {'workers':>7} {'wall s':>8} {'per hour':>10} {'calls/t':>9} {'tokens/t':>10} {'MB':>8} {'errors':>7} {'failed':>6}")
+        for mode in modes:
+            runner = run_research if mode == "research" else run_tasks
+            results[mode] = []
+            for n_workers in worker_counts:
+                with contextlib.ExitStack() as stack:
+                    if not args.verbose:
+                        stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+                    run = runner(args, topics, n_workers, standins)
+                results[mode].append(run)
+                print_run(mode, run)
+            # scaling curve, relative to the first worker count
+            for run in results[mode]:
+                run["speedup"] = results[mode][0]["wall_time"] / run["wall_time"]
+        for mode in modes:
+            print(f"\n{mode} stages with {results[mode][-1]['workers']} workers:")
+            print_stages(results[mode][-1])
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\nResults written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""Local stand-ins for the services the research pipeline talks to.
+
+One threaded HTTP server plays three roles:
+
+    /v1/chat/completions   OpenAI chat completions (plain and streamed), with configurable latency, 5xx errors and 429s
+    /v7.0/search           Bing Web Search v7, results point at the fixture corpus below
+    /pages, /docs, /big    fixture corpus: html articles (some syndicated duplicates), pdf documents and oversized
+                           pages, half of them announcing their size in Content-Length and half streamed chunked
+
+The completions are not generated text, they are built from the prompt so that every stage of the pipeline gets a
+well-formed answer: subtasks, search queries, page summaries quoting their source link, IAIA reports listing the
+summarized links, self-checks and final summaries. Everything is deterministic for a given seed.
+
+    with StandIns(llm_latency=0.2) as standins:
+        standins.configure()
+        ...  # Orchestrator(..., search_engine="bing") now runs offline
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+WORDS = ("market", "growth", "energy", "solar", "battery", "storage", "policy", "regulation", "demand", "supply",
+         "price", "investment", "technology", "adoption", "consumer", "industry", "analysis", "forecast", "risk",
+         "innovation", "capacity", "efficiency", "network", "platform", "revenue", "margin", "competition", "europe",
+         "asia", "america", "research", "report", "data", "trend", "model", "customer", "partner", "startup")
+BOILERPLATE = (
+    '<header class="site-header"><nav><a href="/">Home</a> <a href="/news">News</a> <a href="/about">About</a> '
+    '<a href="/contact">Contact</a> <a href="/login">Sign in</a></nav></header>'
+    '<div id="cookie-banner">We use cookies to improve your experience on our site. Accept all cookies to continue.</div>'
+)
+FOOTER = ('<aside class="sidebar"><h3>Related</h3><ul><li><a href="/1">Five things to know about the market this week</a></li>'
+          '<li><a href="/2">Subscribe to our newsletter for daily updates</a></li></ul></aside>'
+          '<footer class="footer">Copyright 2024 Example Media. All rights reserved. Terms of use. Privacy policy.</footer>')
+
+
+def estimate_tokens(text):
+    """Rough token count, about four characters per token"""
+    return max(1, len(text) // 4)
+
+
+class Corpus:
+    """Deterministic fixture pages, generated on first request and kept in memory"""
+
+    def __init__(self, n_pages=200, n_documents=20, n_oversized=20, oversized_bytes=3 * 1024 * 1024, seed=0):
+        """
+        Args:
+            n_pages (int): Number of html articles, every tenth is a copy of the previous one under another path
+            n_documents (int): Number of pdf documents
+            n_oversized (int): Number of pages larger than the scraper's download limit
+            oversized_bytes (int): Size of an oversized page
+            seed (int): Seed of the generated text
+        """
+        self.n_pages = n_pages
+        self.n_documents = n_documents
+        self.n_oversized = n_oversized
+        self.oversized_bytes = oversized_bytes
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def paths(self):
+        return ([f"/pages/{i}.html" for i in range(self.n_pages)] + [f"/docs/{i}.pdf" for i in range(self.n_documents)]
+                + [f"/big/{i}.html" for i in range(self.n_oversized)])
+
+    def sentence(self, rng):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+        return " ".join(words).capitalize() + "."
+
+    def article(self, i):
+        # syndicated copies: the same article under two paths, which the deduplicator should catch
+        rng = random.Random(f"{self.seed}-{i - 1 if i % 10 == 9 else i}")
+        title = " ".join(rng.choice(WORDS) for _ in range(5)).title()
+        paragraphs = "".join(f"<p>{' '.join(self.sentence(rng) for _ in range(rng.randint(3, 8)))}</p>"
+                             for _ in range(rng.randint(8, 30)))
+        return (f"<!DOCTYPE html><html><head><title>{title}</title><script>var tracking = {{id: {i}}};</script>"
+                f"<style>body {{ font-family: sans-serif; }}</style></head><body>{BOILERPLATE}"
+                f"<main><article><h1>{title}</h1>{paragraphs}</article></main>{FOOTER}</body></html>")
+
+    def document(self, i):
+        rng = random.Random(f"{self.seed}-doc-{i}")
+        stream = " ".join(self.sentence(rng) for _ in range(400)).encode("latin-1")
+        return b"%PDF-1.4\n1 0 obj << /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream\nendobj\n%%EOF\n"
+
+    def oversized(self, i):
+        body = self.article(i * 7 % max(self.n_pages, 1)).encode("utf-8")
+        head, _, tail = body.partition(b"</article>")
+        filler = head[head.index(b"<p>"):]
+        return head + filler * (self.oversized_bytes // max(len(filler), 1)) + b"</article>" + tail
+
+    def get(self, path):
+        """Return (content type, body) of a fixture path, None if there is no such page"""
+        match = re.fullmatch(r"/(pages|docs|big)/(\d+)\.(html|pdf)", path)
+        if match is None:
+            return None
+        kind, i = match.group(1), int(match.group(2))
+        limits = {"pages": self.n_pages, "docs": self.n_documents, "big": self.n_oversized}
+        if i >= limits[kind]:
+            return None
+        with self._lock:
+            if path not in self._cache:
+                if kind == "pages":
+                    self._cache[path] = ("text/html; charset=utf-8", self.article(i).encode("utf-8"))
+                elif kind == "docs":
+                    self._cache[path] = ("application/pdf", self.document(i))
+                else:
+                    self._cache[path] = ("text/html; charset=utf-8", self.oversized(i))
+            return self._cache[path]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # dozens of workers connect at once
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # clients hang up in the middle of oversized pages and cancelled requests, that is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandIns:
+    """Fake OpenAI, Bing and web server on one local port"""
+
+    def __init__(self, host="127.0.0.1", port=0, llm_latency=0.2, llm_jitter=0.25, tokens_per_second=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=0.1, search_latency=0.05, page_latency=0.05,
+                 results_per_query=10, pdf_rate=0.1, oversized_rate=0.1, corpus=None, seed=0):
+        """
+        Args:
+            host (str): Interface to listen on
+            port (int): Port, a free port if 0
+            llm_latency (float): Mean seconds until a completion (or its first streamed piece) is returned
+            llm_jitter (float): Relative jitter of all latencies, uniformly distributed
+            tokens_per_second (float): Generation speed of completions, instantaneous if 0
+            error_rate (float): Fraction of completion requests answered with a 500 error
+            rate_limit_rate (float): Fraction of completion requests answered with a 429 error
+            retry_after (float): Seconds announced in the Retry-After header of a 429
+            search_latency (float): Mean seconds of a search request
+            page_latency (float): Mean seconds until a fixture page starts downloading
+            results_per_query (int): Number of search results per query
+            pdf_rate (float): Fraction of search results pointing at pdf documents
+            oversized_rate (float): Fraction of search results pointing at oversized pages
+            corpus (Corpus): Fixture pages, a default corpus if None
+            seed (int): Seed of the injected errors, latencies and search results
+        """
+        self.llm_latency = llm_latency
+        self.llm_jitter = llm_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        self.results_per_query = results_per_query
+        self.pdf_rate = pdf_rate
+        self.oversized_rate = oversized_rate
+        self.corpus = corpus or Corpus(seed=seed)
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+        self.server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="standins", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+        return False
+
+    def configure(self):
+        """Point the openai module and the Bing search of WebScraper at the stand-ins"""
+        import openai
+        openai.api_base = f"{self.url}/v1"
+        openai.api_key = "sk-offline-benchmark"
+        os.environ["OPENAI_API_KEY"] = openai.api_key
+        os.environ["BING_SEARCH_V7_ENDPOINT"] = f"{self.url}/"
+        os.environ["BING_SEARCH_V7_SUBSCRIPTION_KEY"] = "offline-benchmark"
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"chat_requests": 0, "chat_streams": 0, "chat_errors": 0, "chat_rate_limited": 0,
+                           "prompt_tokens": 0, "completion_tokens": 0, "calls_by_kind": {},
+                           "search_requests": 0, "page_requests": 0, "page_bytes_sent": 0, "page_aborted": 0}
+
+    def stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _sleep(self, mean):
+        if mean > 0:
+            time.sleep(mean * (1 + self.llm_jitter * (2 * self._random() - 1)))
+
+    # --- chat completions ---
+
+    def completion(self, messages):
+        """Build a plausible completion from the prompt, return (kind, text)"""
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        user = messages[-1]["content"]
+        if "Self-check" in user:
+            return "self_check", "All good."
+        quoted = re.search(r"'(.*)'", user, re.DOTALL)
+        topic = quoted.group(1) if quoted else user.strip()
+        count = re.search(r"Generate (\d+)", user)
+        count = int(count.group(1)) if count else 3
+        if "list of independent subtasks" in system:
+            aspects = ("market size", "key players", "technology trends", "regulation", "risks", "customer demand",
+                       "pricing", "outlook")
+            tasks = ";".join(f"Research the {aspects[i % len(aspects)]} of {topic}" for i in range(count))
+            return "create_tasks", "{TASKS_START}" + tasks + "{TASKS_END}"
+        if "search queries" in system:
+            suffixes = ("overview", "statistics", "analysis", "news", "forecast")
+            return "queries", "\n".join(f"{topic[:100]} {suffixes[i % len(suffixes)]}" for i in range(count))
+        if "summary of the web page" in system:
+            link = re.search(r"\[SourceLink\](\S+)", user)
+            text = user.split("[Text]", 1)[-1]
+            sentences = re.split(r"(?<=\.)\s+", text.strip())[:4]
+            return "summarize_page", f"[SourceLink]{link.group(1) if link else ''}\n[Summary]{' '.join(sentences)[:800]}"
+        if "IAIA" in system or "IAIA report" in user:
+            task = re.search(r"\[Task\]='([^']*)'", user)
+            links = list(dict.fromkeys(re.findall(r"\[SourceLink\]'?(https?://[^\s']+)", user)))
+            sentences = re.findall(r"\[Summary\]([^.]*\.)", user)
+            information = " ".join(sentences[:4]) or "The sources contain little information on the task."
+            return "protocol_response", (
+                f"Task: {task.group(1) if task else topic}\n\n"
+                f"Information: {information}\n\n"
+                "Analysis: The sources agree on the main trends and differ on the size of the effects.\n\n"
+                "Insight: Growth depends on prices, regulation and the adoption by customers.\n\n"
+                "Action: Monitor the market, compare the key players and revisit the forecast every quarter.\n\n"
+                "Sources: " + "\n".join(links) + "\n")
+        if "manager of a team of AI analysts" in system:
+            sections = re.findall(r"Insight:([^\n]*)", user)
+            body = " ".join(section.strip() for section in sections[:8]) or "The subtasks produced no results."
+            return "combine", f"Summary: {body}\n\nConclusion: The research covered {len(sections)} reports."
+        return "other", "OK"
+
+    def handle_chat(self, handler, request):
+        with self._lock:
+            self._stats["chat_requests"] += 1
+        roll = self._random()
+        if roll < self.rate_limit_rate:
+            self._count("chat_rate_limited")
+            self._sleep(self.llm_latency * 0.1)
+            return handler.send_json(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                                     "code": "rate_limit_exceeded"}},
+                                     headers={"Retry-After": f"{self.retry_after:g}"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("chat_errors")
+            self._sleep(self.llm_latency)
+            return handler.send_json(500, {"error": {"message": "The server had an error while processing your request.",
+                                                     "type": "server_error"}})
+
+        messages = request.get("messages", [])
+        kind, text = self.completion(messages)
+        prompt_tokens = estimate_tokens("".join(message["content"] for message in messages))
+        completion_tokens = estimate_tokens(text)
+        with self._lock:
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["completion_tokens"] += completion_tokens
+            self._stats["calls_by_kind"][kind] = self._stats["calls_by_kind"].get(kind, 0) + 1
+
+        self._sleep(self.llm_latency)
+        generation = completion_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        created = int(time.time())
+        if not request.get("stream"):
+            time.sleep(generation)
+            return handler.send_json(200, {
+                "id": "chatcmpl-offline", "object": "chat.completion", "created": created, "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}})
+
+        self._count("chat_streams")
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        handler.start_chunked(200, "text/event-stream")
+        for piece in pieces:
+            chunk = {"id": "chatcmpl-offline", "object": "chat.completion.chunk", "created": created, "model": request.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            handler.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            time.sleep(generation / len(pieces))
+        handler.write_chunk(b"data: [DONE]\n\n")
+        handler.end_chunked()
+
+    # --- search ---
+
+    def search_results(self, query):
+        """Deterministic result urls for a query, a mix of articles, pdf documents and oversized pages"""
+        rng = random.Random(hashlib.sha1(f"{self.seed}-{query}".encode("utf-8")).hexdigest())
+        urls = []
+        for _ in range(self.results_per_query):
+            roll = rng.random()
+            if roll < self.pdf_rate and self.corpus.n_documents:
+                path = f"/docs/{rng.randrange(self.corpus.n_documents)}.pdf"
+            elif roll < self.pdf_rate + self.oversized_rate and self.corpus.n_oversized:
+                path = f"/big/{rng.randrange(self.corpus.n_oversized)}.html"
+            else:
+                path = f"/pages/{rng.randrange(self.corpus.n_pages)}.html"
+            # tracking parameters the url canonicalization should strip
+            urls.append(f"{self.url}{path}" + ("?utm_source=search&utm_medium=bench" if rng.random() < 0.2 else ""))
+        return urls
+
+    def handle_search(self, handler, query):
+        self._count("search_requests")
+        self._sleep(self.search_latency)
+        handler.send_json(200, {"_type": "SearchResponse", "queryContext": {"originalQuery": query},
+                                "webPages": {"value": [{"name": url, "url": url} for url in self.search_results(query)]}})
+
+    # --- fixture pages ---
+
+    def handle_page(self, handler, path):
+        page = self.corpus.get(path)
+        if page is None:
+            return handler.send_json(404, {"error": "not found"})
+        self._count("page_requests")
+        self._sleep(self.page_latency)
+        content_type, body = page
+        index = int(re.search(r"(\d+)", path).group(1))
+        try:
+            if path.startswith("/big/") and index % 2:
+                # no Content-Length, the scraper has to stop reading by itself
+                handler.start_chunked(200, content_type)
+                for i in range(0, len(body), 64 * 1024):
+                    handler.write_chunk(body[i:i + 64 * 1024])
+                    self._count("page_bytes_sent", min(64 * 1024, len(body) - i))
+                handler.end_chunked()
+            else:
+                handler.send_body(200, content_type, body)
+                self._count("page_bytes_sent", len(body))
+        except (BrokenPipeError, ConnectionResetError):
+            self._count("page_aborted")
+            handler.close_connection = True
+
+    def _handler_class(self):
+        standins = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, content_type, body, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, status, payload, headers=None):
+                self.send_body(status, "application/json", json.dumps(payload).encode("utf-8"), headers)
+
+            def start_chunked(self, status, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def end_chunked(self):
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == "/v1/models":
+                    return self.send_json(200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]})
+                if url.path == "/v7.0/search":
+                    return standins.handle_search(self, parse_qs(url.query).get("q", [""])[0])
+                return standins.handle_page(self, url.path)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlsplit(self.path).path != "/v1/chat/completions":
+                    return self.send_json(404, {"error": {"message": "not found"}})
+                standins.handle_chat(self, json.loads(body or b"{}"))
+
+        return Handler
@@ -1,23 +1,76 @@
-from osi.src.Validator import Validator
-from osi.src.Worker import Worker
+import sys
+import argparse
 from osi.src.Orchestrator import Orchestrator
+from osi.src.BatchRunner import BatchRunner
+from osi.src.OpenAICaller import OpenAICaller
 
-def main(research_topic):
-    # Initialize OpenAICaller, WebScraper, and Validator instances
-    validator = Validator()
+def check_connection():
+    # Fail fast on a missing api key or an unreachable api, before any work is started
+    if not OpenAICaller.check_connection():
+        raise SystemExit("Cannot reach the OpenAI API, check OPENAI_API_KEY and the network connection")
 
-    # Initialize Workers with the OpenAICaller and WebScraper instances
-    workers = [Worker() for _ in range(3)]
+def main(research_topic, n_workers=3, search_engine="google", run_id=None):
+    check_connection()
 
-    # Initialize the Orchestrator with the Workers
-    orchestrator = Orchestrator(workers)
+    # The Orchestrator creates the Workers, they share its caches, connections and rate budget
+    orchestrator = Orchestrator(n_workers=n_workers, search_engine=search_engine)
+
+    # A resumed run keeps its topic
+    if run_id is not None:
+        research_topic = orchestrator.artifacts.run(run_id).topic
 
     # Perform the research and obtain the final report
-    final_report = orchestrator.perform_research(research_topic)
+    try:
+        reports, final_report = orchestrator.perform_research(research_topic, run_id=run_id)
+    finally:
+        orchestrator.close()
 
     # Print the final report
     print(final_report)
 
+def batch(topics, output, n_workers=8, search_engine="google", max_open_topics=None, task_timeout=None):
+    """Research many topics on one shared pool of workers and write one JSON line per topic
+
+    Args:
+        topics (Iterable[str]): Research topics, one per item
+        output (TextIO): JSONL output, a record is written as soon as its topic is finished
+        n_workers (int): Number of workers shared by all topics
+        search_engine (str): "google" or "bing"
+        max_open_topics (int): Topics in progress at a time, see BatchRunner
+        task_timeout (float): Seconds after which a single subtask is abandoned
+
+    Returns:
+        dict: throughput statistics
+    """
+    check_connection()
+    orchestrator = Orchestrator(n_workers=n_workers, search_engine=search_engine)
+    runner = BatchRunner(orchestrator, max_open_topics=max_open_topics, task_timeout=task_timeout)
+    try:
+        return runner.run(topics, output)
+    finally:
+        orchestrator.close()
+
 if __name__ == "__main__":
-    research_topic = "Renewable energy sources"
-    main(research_topic)
+    parser = argparse.ArgumentParser(description="Research a topic, or a batch of topics with --topics-file")
+    parser.add_argument("topic", nargs="?", default="Renewable energy sources")
+    parser.add_argument("--topics-file", help="file with one topic per line, - for stdin")
+    parser.add_argument("--output", default="osi_results.jsonl", help="JSONL output of a batch, - for stdout")
+    parser.add_argument("--workers", type=int, default=None, help="number of workers (3 for a single topic, 8 for a batch)")
+    parser.add_argument("--search-engine", default="google", choices=("google", "bing"))
+    parser.add_argument("--max-open-topics", type=int, default=None)
+    parser.add_argument("--task-timeout", type=float, default=None)
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume an interrupted run, its topic is reused")
+    args = parser.parse_args()
+
+    if args.topics_file is None:
+        main(args.topic, n_workers=args.workers or 3, search_engine=args.search_engine, run_id=args.resume)
+    else:
+        topics = sys.stdin if args.topics_file == "-" else open(args.topics_file, encoding="utf-8")
+        output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+        try:
+            batch(topics, output, n_workers=args.workers or 8, search_engine=args.search_engine,
+                  max_open_topics=args.max_open_topics, task_timeout=args.task_timeout)
+        finally:
+            for f in (topics, output):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
@@ -0,0 +1,172 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from osi.src.utils import cache_path
+
+class ArtifactStore:
+    """Persists the intermediate results of research runs in SQLite.
+
+    Every artifact is a JSON value keyed by (run_id, stage, key), e.g. ("3f2a...", "summary", subtask + url). The
+    Orchestrator and the Workers write each stage's output as soon as it exists and look it up before doing the
+    work, so a run restarted with the same run id only repeats what was lost. Artifacts are written with one
+    short transaction each and are visible to other processes sharing the file. Runs not updated for max_age are
+    deleted with their artifacts when the store is opened.
+    """
+    # separates the parts of composite keys such as subtask + url
+    KEY_SEPARATOR = "\x1f"
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=":memory:", max_age=30*24*3600):
+        """
+        Args:
+            path (str): SQLite file, in memory if ":memory:"
+            max_age (float): Seconds after their last update that runs are kept, forever if None
+        """
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, topic TEXT, created_at REAL, updated_at REAL, status TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts (run_id TEXT, stage TEXT, key TEXT, value TEXT, created_at REAL, "
+            "PRIMARY KEY (run_id, stage, key))"
+        )
+        self._db.commit()
+        if max_age is not None:
+            self.prune(max_age)
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide store persisted to $OSI_CACHE_DIR/artifacts.sqlite, creating it on first use"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(path=cache_path("artifacts.sqlite"))
+        return cls._shared
+
+    @staticmethod
+    def new_run_id():
+        return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+    def run(self, run_id=None, topic=None):
+        """Open a run, registering it if it is new
+
+        Args:
+            run_id (str): Id of the run to resume, a new run if None
+            topic (str): Research topic, required for a new run
+
+        Returns:
+            RunArtifacts: the artifacts of the run
+        """
+        run_id = run_id or self.new_run_id()
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT topic FROM runs WHERE run_id=?", (run_id,)).fetchone()
+            if row is None:
+                if topic is None:
+                    raise KeyError(f"Unknown run '{run_id}'")
+                self._db.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)", (run_id, topic, now, now, "running"))
+                self._db.commit()
+            elif topic is not None and row[0] != topic:
+                raise ValueError(f"Run '{run_id}' researched '{row[0]}', not '{topic}'")
+            else:
+                topic = row[0]
+        return RunArtifacts(self, run_id, topic)
+
+    def runs(self, limit=20):
+        """Return the most recently updated runs as dicts with run_id, topic, created_at, updated_at and status"""
+        with self._lock:
+            rows = self._db.execute("SELECT run_id, topic, created_at, updated_at, status FROM runs ORDER BY updated_at DESC LIMIT ?",
+                                    (limit,)).fetchall()
+        return [dict(zip(("run_id", "topic", "created_at", "updated_at", "status"), row)) for row in rows]
+
+    def set_status(self, run_id, status):
+        with self._lock:
+            self._db.execute("UPDATE runs SET status=?, updated_at=? WHERE run_id=?", (status, time.time(), run_id))
+            self._db.commit()
+
+    def get(self, run_id, stage, key=""):
+        """Return the stored value or None"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM artifacts WHERE run_id=? AND stage=? AND key=?", (run_id, stage, key)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, run_id, stage, key, value):
+        """Store a JSON-serializable value, replacing the previous value of the key"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                             (run_id, stage, key, json.dumps(value, ensure_ascii=False), now))
+            self._db.execute("UPDATE runs SET updated_at=? WHERE run_id=?", (now, run_id))
+            self._db.commit()
+
+    def items(self, run_id, stage, prefix=""):
+        """Return the (key, value) pairs of a stage whose key starts with prefix, in the order they were stored"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, value FROM artifacts WHERE run_id=? AND stage=? AND substr(key, 1, ?)=? ORDER BY created_at, rowid",
+                (run_id, stage, len(prefix), prefix)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def delete(self, run_id, stage=None):
+        """Delete the artifacts of a stage, or the whole run if stage is None"""
+        with self._lock:
+            if stage is None:
+                self._db.execute("DELETE FROM artifacts WHERE run_id=?", (run_id,))
+                self._db.execute("DELETE FROM runs WHERE run_id=?", (run_id,))
+            else:
+                self._db.execute("DELETE FROM artifacts WHERE run_id=? AND stage=?", (run_id, stage))
+            self._db.commit()
+
+    def prune(self, max_age):
+        """Delete the runs not updated for max_age seconds and their artifacts
+
+        Returns:
+            int: number of deleted runs
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            self._db.execute("DELETE FROM artifacts WHERE run_id IN (SELECT run_id FROM runs WHERE updated_at < ?)", (cutoff,))
+            n_runs = self._db.execute("DELETE FROM runs WHERE updated_at < ?", (cutoff,)).rowcount
+            self._db.commit()
+        return n_runs
+
+    def stats(self):
+        """Return the number of runs and the number of artifacts per stage"""
+        with self._lock:
+            n_runs = self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            stages = dict(self._db.execute("SELECT stage, COUNT(*) FROM artifacts GROUP BY stage").fetchall())
+        return {"runs": n_runs, "artifacts": stages}
+
+
+class RunArtifacts:
+    """The artifacts of one run, passed to the Workers through their TaskState"""
+
+    def __init__(self, store, run_id, topic):
+        self.store = store
+        self.run_id = run_id
+        self.topic = topic
+
+    def key(self, *parts):
+        return ArtifactStore.KEY_SEPARATOR.join(parts)
+
+    def get(self, stage, key=""):
+        return self.store.get(self.run_id, stage, key)
+
+    def put(self, stage, key, value):
+        self.store.put(self.run_id, stage, key, value)
+
+    def items(self, stage, prefix=""):
+        return self.store.items(self.run_id, stage, prefix)
+
+    def set_status(self, status):
+        self.store.set_status(self.run_id, status)
+
+    def __repr__(self):
+        return f"RunArtifacts(run_id={self.run_id!r}, topic={self.topic!r})"
@@ -0,0 +1,220 @@
+import json
+import time
+import queue
+import itertools
+import threading
+import concurrent.futures
+from osi.src.TaskState import TaskState
+from osi.src.Deduplicator import Deduplicator
+
+class BatchRunner:
+    """Researches many topics on the workers, caches, HTTP connections and rate budget of one Orchestrator.
+
+    The subtasks of all open topics go into one priority queue served by every worker, so the workers keep
+    running subtasks of the next topics while the results of a finished topic are combined. Planning
+    (create_tasks) and combining (combine_results) run on their own small pool. Earlier topics have priority, so
+    topics finish roughly in input order and at most max_open_topics topics are held in memory at a time.
+    """
+    _STOP = (float("inf"), 0, None)
+
+    def __init__(self, orchestrator, max_open_topics=None, planners=2, task_timeout=None):
+        """
+        Args:
+            orchestrator (Orchestrator): Provides the workers, the shared caller and scraper, create_tasks and combine_results
+            max_open_topics (int): Topics planned but not yet combined, defaults to the number of workers
+            planners (int): Threads creating subtasks and combining results
+            task_timeout (float): Seconds after which a single subtask is abandoned
+        """
+        self.orchestrator = orchestrator
+        self.max_open_topics = max_open_topics or max(2, len(orchestrator.workers))
+        self.planners = planners
+        self.task_timeout = task_timeout
+        self.cancel_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def log(self, message):
+        """Log a message to the console
+
+        Args:
+            message (str): Message to log
+        """
+        print(f"{self.__class__.__name__}: {message}")
+
+    def cancel(self):
+        """Stop the batch, running subtasks are interrupted and the remaining topics are not started"""
+        self.cancel_event.set()
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def iter_results(self, topics):
+        """Research the topics and yield one record per topic as soon as it is finished
+
+        Records are dicts with the keys "topic", "status" ("done", "failed" or "cancelled"), "report" (the final report),
+        "reports" (the report of every successful subtask), "failed_tasks" (status or error of the other subtasks),
+        "tokens" (spent on the subtasks), "duration" and "error".
+
+        Args:
+            topics (Iterable[str]): Research topics, read lazily so a file or stdin can be streamed
+
+        Yields:
+            dict: one record per topic, in completion order
+        """
+        self.cancel_event = threading.Event()
+        usage = self.orchestrator.openai.usage()
+        with self._stats_lock:
+            self._stats = {"topics": 0, "topics_done": 0, "topics_failed": 0, "topics_cancelled": 0, "subtasks": 0,
+                           "subtasks_failed": 0, "started_at": time.time(), "prompt_tokens": -usage["prompt_tokens"],
+                           "completion_tokens": -usage["completion_tokens"], "calls": -usage["calls"]}
+
+        workers = self.orchestrator.workers
+        task_queue = queue.PriorityQueue()
+        done_queue = queue.Queue()
+        # bounds the topics between planning and combining
+        open_topics = threading.BoundedSemaphore(self.max_open_topics)
+        sequence = itertools.count()
+        topic_lock = threading.Lock()
+        pending = {}
+
+        def finish(topic, record):
+            record["duration"] = time.time() - topic["started_at"]
+            self._count({"done": "topics_done", "cancelled": "topics_cancelled"}.get(record["status"], "topics_failed"))
+            done_queue.put(record)
+            open_topics.release()
+
+        def plan(topic):
+            try:
+                tasks = list(dict.fromkeys(self.orchestrator.create_tasks(topic["topic"])))
+                if not tasks:
+                    raise ValueError("No subtasks were created")
+            except Exception as e:
+                finish(topic, {"topic": topic["topic"], "status": "failed", "report": None, "reports": {}, "failed_tasks": {},
+                               "tokens": 0, "error": f"{type(e).__name__}: {e}"})
+                return
+            # urls and pages are deduplicated within a topic, like in a single research run
+            deduplicator = Deduplicator()
+            topic["states"] = [TaskState(task, cancel_event=self.cancel_event, deduplicator=deduplicator) for task in tasks]
+            with topic_lock:
+                pending[topic["seq"]] = len(tasks)
+            self._count("subtasks", len(tasks))
+            for i, state in enumerate(topic["states"]):
+                task_queue.put((topic["seq"], i, (topic, state)))
+
+        def combine(topic):
+            states = topic["states"]
+            reports = {state.task: state.result for state in states if state.status == TaskState.DONE}
+            failed = {state.task: str(state.error) if state.error is not None else state.status
+                      for state in states if state.status != TaskState.DONE}
+            record = {"topic": topic["topic"], "status": "done", "report": None, "reports": reports, "failed_tasks": failed,
+                      "tokens": sum(state.tokens_used for state in states), "error": None}
+            if self.cancel_event.is_set():
+                # the reports of a cancelled batch are kept, but no more API calls are made for it
+                record["status"] = TaskState.CANCELLED
+                finish(topic, record)
+                return
+            try:
+                if not reports:
+                    raise RuntimeError("All subtasks failed")
+                record["report"] = self.orchestrator.combine_results(topic["topic"], list(reports.values()))
+            except Exception as e:
+                record["status"], record["error"] = "failed", f"{type(e).__name__}: {e}"
+            finish(topic, record)
+
+        def work(worker):
+            while True:
+                _, _, item = task_queue.get()
+                if item is None:
+                    return
+                topic, state = item
+                if state.cancelled:
+                    state.finish(TaskState.CANCELLED)
+                else:
+                    self.orchestrator.run_task(worker, state, task_timeout=self.task_timeout)
+                if state.status != TaskState.DONE:
+                    self._count("subtasks_failed")
+                with topic_lock:
+                    pending[topic["seq"]] -= 1
+                    last = pending[topic["seq"]] == 0
+                if last:
+                    # combining runs beside the workers, which go on with the next topics
+                    planner.submit(combine, topic)
+
+        def feed():
+            n_topics = 0
+            try:
+                for text in topics:
+                    text = text.strip()
+                    if not text:
+                        continue
+                    while not open_topics.acquire(timeout=0.1):
+                        if self.cancel_event.is_set():
+                            break
+                    if self.cancel_event.is_set():
+                        break
+                    n_topics += 1
+                    self._count("topics")
+                    planner.submit(plan, {"topic": text, "seq": next(sequence), "started_at": time.time()})
+            finally:
+                done_queue.put(n_topics)
+
+        planner = concurrent.futures.ThreadPoolExecutor(max_workers=self.planners)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(workers) + 1) as executor:
+                executor.submit(feed)
+                for worker in workers:
+                    executor.submit(work, worker)
+                n_topics, n_finished = None, 0
+                try:
+                    while n_topics is None or n_finished < n_topics:
+                        record = done_queue.get()
+                        if isinstance(record, int):
+                            n_topics = record
+                            continue
+                        n_finished += 1
+                        yield record
+                finally:
+                    if n_topics is None or n_finished < n_topics:
+                        # the consumer stopped early, the queued subtasks are skipped as cancelled
+                        self.cancel()
+                    # sorts after every subtask
+                    for _ in workers:
+                        task_queue.put(self._STOP)
+        finally:
+            planner.shutdown(wait=True)
+
+    def run(self, topics, output):
+        """Research the topics and write one JSON line per topic to output as soon as it is finished
+
+        Args:
+            topics (Iterable[str]): Research topics
+            output (TextIO): Writable text file, flushed after every record
+
+        Returns:
+            dict: throughput statistics, see stats
+        """
+        for record in self.iter_results(topics):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            self.log(f"{record['status']}: '{record['topic']}' in {record['duration']:.1f}s ({self.stats()['topics_per_hour']:.0f} topics/hour)")
+        stats = self.stats()
+        self.log(f"Batch finished: {json.dumps(stats)}")
+        return stats
+
+    def stats(self):
+        """Return the counters of the current batch with topics per hour and API tokens per finished topic"""
+        usage = self.orchestrator.openai.usage()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        if not stats:
+            return {}
+        stats["prompt_tokens"] += usage["prompt_tokens"]
+        stats["completion_tokens"] += usage["completion_tokens"]
+        stats["calls"] += usage["calls"]
+        elapsed = time.time() - stats.pop("started_at")
+        finished = stats["topics_done"] + stats["topics_failed"]
+        stats["elapsed"] = elapsed
+        stats["topics_per_hour"] = finished / elapsed * 3600 if elapsed > 0 else 0.0
+        stats["tokens_per_topic"] = (stats["prompt_tokens"] + stats["completion_tokens"]) / finished if finished else 0.0
+        return stats
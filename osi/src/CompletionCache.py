@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from osi.src.utils import cache_path
+
+class CompletionCache:
+    """Two-tier cache for chat completions.
+
+    Completions are keyed by a hash of (model, messages, max_tokens, temperature, stop). Lookups go to an in-memory
+    LRU first and to an optional SQLite file second, entries expire after their TTL.
+
+    Requests with a temperature above max_temperature bypass the cache, by default only (nearly) deterministic
+    requests up to 0.3 are cached: a cached sample would give every later run the same answer. The Worker and
+    Orchestrator prompts use 0.5 to 0.7, pass max_temperature=None (or set OSI_COMPLETION_MAX_TEMPERATURE=none for the
+    shared cache) to cache those too, e.g. for repeatable reruns and benchmarks.
+    """
+    DEFAULT_MAX_TEMPERATURE = 0.3
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, ttl=7*24*3600, max_memory_entries=1024, max_temperature=DEFAULT_MAX_TEMPERATURE):
+        """
+        Args:
+            path (str): SQLite file for the persistent tier, memory only if None
+            ttl (float): Default seconds an entry stays valid
+            max_memory_entries (int): Capacity of the in-memory LRU tier
+            max_temperature (float): Requests with a higher temperature are not cached, cache all if None
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_temperature = max_temperature
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "tokens_saved": 0}
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, content TEXT, tokens INTEGER, expires_at REAL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide cache persisted to $OSI_CACHE_DIR/completions.sqlite, creating it on first use.
+        Requests above $OSI_COMPLETION_MAX_TEMPERATURE (DEFAULT_MAX_TEMPERATURE if unset, "none" caches all) bypass it"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(path=cache_path("completions.sqlite"), max_temperature=cls.max_temperature_from_env())
+        return cls._shared
+
+    @classmethod
+    def max_temperature_from_env(cls):
+        value = os.getenv("OSI_COMPLETION_MAX_TEMPERATURE", "").strip().lower()
+        if not value:
+            return cls.DEFAULT_MAX_TEMPERATURE
+        return None if value == "none" else float(value)
+
+    @staticmethod
+    def key(model, messages, max_tokens, temperature, stop):
+        payload = json.dumps([model, messages, max_tokens, temperature, stop], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, temperature):
+        return self.max_temperature is None or temperature <= self.max_temperature
+
+    def get(self, key):
+        """Return the cached completion text or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[2] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                self._stats["tokens_saved"] += entry[1]
+                return entry[0]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT content, tokens, expires_at FROM completions WHERE key=?", (key,)).fetchone()
+                if row is not None and row[2] > now:
+                    self._remember(key, row)
+                    self._stats["disk_hits"] += 1
+                    self._stats["tokens_saved"] += row[1]
+                    return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, content, tokens=0, ttl=None):
+        """Store a completion
+
+        Args:
+            key (str): Cache key, see key
+            content (str): Completion text
+            tokens (int): Total tokens the request consumed, used for the tokens_saved counter
+            ttl (float): Seconds the entry stays valid, defaults to the cache TTL
+        """
+        entry = (content, tokens, time.time() + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)", (key,) + entry)
+                self._db.commit()
+
+    def bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def _remember(self, key, entry):
+        self._memory[key] = tuple(entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Return hit counters, hit rate and tokens saved"""
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
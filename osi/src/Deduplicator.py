@@ -0,0 +1,114 @@
+import re
+import threading
+from osi.src.utils import canonicalize_url
+
+class Deduplicator:
+    """Run-wide detection of duplicate urls and near-duplicate pages.
+
+    Urls are compared in canonical form (see canonicalize_url), so the same page behind different tracking
+    parameters is fetched once. Page texts are compared by a 64 bit SimHash over word shingles, so syndicated
+    copies of an article are summarized once. Fingerprints are split into bands, a page is only compared with
+    pages that share a band, and every pair within max_distance bits shares at least one band. A url is claimed
+    while its page is fetched and summarized, and only counts as seen once the summary is committed; a page that
+    fails or is skipped releases its claim, so another candidate or task can still cover it.
+    """
+    WORD = re.compile(r"\w+")
+    N_BITS = 64
+
+    def __init__(self, shingle_size=4, max_distance=3, n_bands=4):
+        """
+        Args:
+            shingle_size (int): Number of words per shingle
+            max_distance (int): Pages whose fingerprints differ in at most this many bits are duplicates
+            n_bands (int): Number of bands of the fingerprint index, must be larger than max_distance
+        """
+        if n_bands <= max_distance:
+            raise ValueError("n_bands must be larger than max_distance")
+        self.shingle_size = shingle_size
+        self.max_distance = max_distance
+        self.n_bands = n_bands
+        self._band_bits = self.N_BITS // n_bands
+
+        self._lock = threading.Lock()
+        self._urls = set()
+        # canonical urls claimed but not yet committed or released, with the fingerprint of their page
+        self._pending = {}
+        self._fingerprints = {}
+        self._bands = [dict() for _ in range(n_bands)]
+        self._stats = {"urls": 0, "url_duplicates": 0, "pages": 0, "content_duplicates": 0}
+
+    def claim_url(self, url):
+        """Claim a url before fetching it, the claim is held until commit or release
+
+        Returns:
+            bool: False if the canonical url is being processed or was summarized in this run, i.e. the page
+                should be skipped
+        """
+        key = canonicalize_url(url)
+        with self._lock:
+            if key in self._urls or key in self._pending:
+                self._stats["url_duplicates"] += 1
+                return False
+            self._pending[key] = None
+            return True
+
+    def commit(self, url):
+        """Mark a claimed page as summarized, later claims of its url and near-duplicates of its text fail"""
+        key = canonicalize_url(url)
+        with self._lock:
+            fingerprint = self._pending.pop(key, None)
+            if key not in self._urls:
+                self._urls.add(key)
+                self._stats["urls"] += 1
+            if fingerprint is not None and url not in self._fingerprints:
+                self._fingerprints[url] = fingerprint
+                for band, band_key in zip(self._bands, self._band_keys(fingerprint)):
+                    band.setdefault(band_key, []).append(url)
+                self._stats["pages"] += 1
+
+    def release(self, url):
+        """Drop the claim of a page that was not summarized (failed, skipped or cancelled), so it can be tried again"""
+        with self._lock:
+            self._pending.pop(canonicalize_url(url), None)
+
+    def fingerprint(self, text):
+        """SimHash of the word shingles of a text"""
+        import numpy as np
+
+        words = self.WORD.findall(text.lower())
+        k = min(self.shingle_size, len(words)) or 1
+        # the builtin hash is salted per process, fingerprints are only ever compared within one run
+        hashes = np.array([hash(" ".join(words[i:i + k])) for i in range(max(len(words) - k + 1, 1))], dtype=np.int64)
+        bits = (hashes.view(np.uint64)[:, None] >> np.arange(self.N_BITS, dtype=np.uint64)) & np.uint64(1)
+        majority = 2 * bits.sum(axis=0, dtype=np.int64) > len(hashes)
+        return sum(1 << int(bit) for bit in np.flatnonzero(majority))
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (band * self._band_bits)) & mask for band in range(self.n_bands)]
+
+    def claim_content(self, text, url):
+        """Check the text of a claimed page before summarizing it, its fingerprint is registered on commit
+
+        Args:
+            text (str): Extracted page text
+            url (str): Link of the page
+
+        Returns:
+            str: Url of an earlier summarized near-duplicate page of this run, None if the page is new
+        """
+        fingerprint = self.fingerprint(text)
+        band_keys = self._band_keys(fingerprint)
+        with self._lock:
+            for band, key in zip(self._bands, band_keys):
+                for candidate in band.get(key, ()):
+                    if bin(fingerprint ^ self._fingerprints[candidate]).count("1") <= self.max_distance:
+                        self._stats["content_duplicates"] += 1
+                        return candidate
+            self._pending[canonicalize_url(url)] = fingerprint
+            return None
+
+    def stats(self):
+        """Return the number of summarized urls and pages and of the dropped duplicates"""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+class HttpClient:
+    """Connection-pooled HTTP client shared by all WebScraper instances.
+
+    Wraps a single requests.Session so repeated requests to the same host reuse keep-alive connections. At most
+    max_connections_per_host connections to a host are open at a time, further requests to it wait for a free one.
+    Every request gets connect/read timeouts and transient failures are retried with jittered exponential backoff.
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    DEFAULT_HEADERS = {
+        "User-Agent": "Mozilla/5.0 (compatible; OSI-research-bot/1.0)",
+        "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9,*/*;q=0.5",
+    }
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_hosts=32, max_connections_per_host=8, connect_timeout=5.0, read_timeout=15.0,
+                 max_retries=2, backoff_factor=0.5, max_backoff=8.0):
+        """
+        Args:
+            max_hosts (int): Number of per-host connection pools kept alive
+            max_connections_per_host (int): Maximum number of concurrent connections per host
+            connect_timeout (float): Seconds to wait for a TCP/TLS connection
+            read_timeout (float): Seconds to wait between bytes of the response
+            max_retries (int): Number of retries after the first attempt
+            backoff_factor (float): Base delay in seconds for the exponential backoff
+            max_backoff (float): Upper bound for a single backoff delay
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        self.adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=max_connections_per_host,
+                                   pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide client, creating it on first use"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _backoff(self, attempt, response=None):
+        """Sleep before the next attempt, honouring Retry-After when the server sends one"""
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            delay = min(self.max_backoff, float(response.headers["Retry-After"]))
+        # full jitter, so parallel workers do not retry in lockstep
+        time.sleep(random.uniform(0, delay))
+
+    def request(self, method, url, **kwargs):
+        """Send a request with timeouts and retries
+
+        Args:
+            method (str): HTTP method
+            url (str): Url to request
+            **kwargs: Forwarded to requests.Session.request
+
+        Returns:
+            requests.Response: The last response received
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self._count("requests")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._count("errors")
+                if attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                self._backoff(attempt)
+                continue
+
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._count("retries")
+                response.close()
+                self._backoff(attempt, response)
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        """Send a GET request, see request"""
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        """Return request counters and connection pool statistics
+
+        Returns:
+            dict: requests, retries, errors, connections_opened, connections_reused and per-host details
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+        stats["hosts"] = hosts
+        stats["connections_opened"] = sum(host["connections_opened"] for host in hosts.values())
+        stats["connections_reused"] = sum(host["requests"] for host in hosts.values()) - stats["connections_opened"]
+        return stats
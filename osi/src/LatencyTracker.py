@@ -0,0 +1,55 @@
+import math
+import threading
+from collections import defaultdict, deque
+
+class LatencyTracker:
+    """Per-stage latency samples with p50/p95/p99 summaries.
+
+    Stages are the span names of the Tracer, which records every finished span here, e.g. "internet_search",
+    "scrape" or "summarize_page". Only the most recent max_samples durations of every stage are kept, so a long
+    running process reports its current behaviour.
+    """
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self, max_samples=10000):
+        """
+        Args:
+            max_samples (int): Number of most recent samples kept per stage
+        """
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._counts = defaultdict(int)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+
+    def percentiles(self, stage):
+        """Return count, p50, p95, p99 and max in seconds for a stage, None if it has no samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+            count = self._counts.get(stage, 0)
+        if not samples:
+            return None
+        # nearest-rank percentiles
+        stats = {"count": count}
+        for quantile in self.QUANTILES:
+            stats[f"p{quantile}"] = samples[max(math.ceil(quantile / 100 * len(samples)) - 1, 0)]
+        stats["max"] = samples[-1]
+        return stats
+
+    def stats(self):
+        """Return the percentiles of every stage"""
+        with self._lock:
+            stages = list(self._samples)
+        return {stage: self.percentiles(stage) for stage in stages}
+
+    def summary(self):
+        """Format the percentiles of every stage as a table, in milliseconds"""
+        lines = [f"{'stage':<24} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+        for stage, stats in self.stats().items():
+            lines.append(f"{stage:<24} {stats['count']:>6} " + " ".join(
+                f"{stats[key] * 1000:>8.0f}" for key in ("p50", "p95", "p99", "max")))
+        return "\n".join(lines)
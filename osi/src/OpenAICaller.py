@@ -1,25 +1,225 @@
-import sys
 import os
-import openai
+import time
+import threading
+import contextlib
+from osi.src.SingleFlight import SingleFlight
+from osi.src.RateLimiter import RateLimiter
+from osi.src.TokenBudget import TokenBudget
+from osi.src.Tracer import current_span
 
 class OpenAICaller:
     """This class is responsible for interacting with the openai API
     """
-    def __init__(self, model_name):
+    MAX_RATE_LIMIT_RETRIES = 5
+
+    # the openai module is imported and configured once per process, on first use
+    _client = None
+    _client_lock = threading.Lock()
+    _connection_ok = None
+
+    def __init__(self, model_name, cache=None, rate_limiter=None, inflight=None):
         self.model_name = model_name
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        self.cache = cache
+        # optional semaphore capping the number of API calls in flight, may be shared between callers
+        self.inflight = inflight or contextlib.nullcontext()
+        # all callers go through one scheduler so the workers share the provider quota
+        self.rate_limiter = rate_limiter or RateLimiter.shared()
+        self.budget = TokenBudget.for_model(model_name)
+        self._flight = SingleFlight()
+        self._usage_lock = threading.Lock()
+        self._usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    @classmethod
+    def client(cls):
+        """Return the openai module, importing it and setting the api key on first use"""
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    import openai
+                    openai.api_key = openai.api_key or os.getenv("OPENAI_API_KEY")
+                    cls._client = openai
+        return cls._client
+
+    @classmethod
+    def check_connection(cls, force=False):
+        """Check that the api key is set and the openai api is reachable.
+
+        The check runs at most once per process unless force is set.
 
-        ## check is openai api key is set and openai api is working
+        Returns:
+            bool: True if the api answered
+        """
+        with cls._client_lock:
+            if cls._connection_ok is not None and not force:
+                return cls._connection_ok
         try:
-            models = openai.Model.list()
+            cls.client().Model.list()
             print("Connection successful!")
-            print("Available models:")
-            # for model in models["data"]:
-            #     print(f"Model: {model['id']}")
+            connection_ok = True
         except Exception as e:
             print(f"Error: {e}")
-            sys.exit(1)
+            connection_ok = False
+        with cls._client_lock:
+            cls._connection_ok = connection_ok
+        return connection_ok
     
-    def gen_request_to_api(self, messages, max_tokens=100, temperature=0.5, n=1, stop=None):
-        response = openai.ChatCompletion.create(model=self.model_name, messages=messages, max_tokens=max_tokens, temperature=temperature)
-        return response["choices"][0]["message"]["content"]
\ No newline at end of file
+    def gen_request_to_api(self, messages, max_tokens=100, temperature=0.5, n=1, stop=None, use_cache=True,
+                           priority=RateLimiter.PRIORITY_NORMAL, with_usage=False):
+        """Request a chat completion, served from the completion cache when possible
+
+        Args:
+            messages (list[dict]): Chat messages
+            max_tokens (int): Maximum number of completion tokens
+            temperature (float): Sampling temperature
+            n (int): Number of completions (only the first one is returned)
+            stop (str|list): Stop sequence(s)
+            use_cache (bool): Set to False to always call the API
+            priority (int): Scheduling priority in the rate limiter, see RateLimiter
+            with_usage (bool): Also return the usage reported by the API
+
+        Returns:
+            str: The completion text. With with_usage, a (text, usage) tuple where usage is the "usage" dict of the
+                API response, or None if the completion came from the cache or from an identical concurrent request
+        """
+        usage = None
+        if self.cache is None or not use_cache:
+            content, usage = self._create(messages, max_tokens, temperature, stop, priority)
+        elif not self.cache.is_cacheable(temperature):
+            self.cache.bypass()
+            content, usage = self._create(messages, max_tokens, temperature, stop, priority)
+        else:
+            key = self.cache.key(self.model_name, messages, max_tokens, temperature, stop)
+            content = self.cache.get(key)
+            if content is not None:
+                current_span().add("cache_hits")
+            else:
+                def create():
+                    nonlocal usage
+                    content, usage = self._create(messages, max_tokens, temperature, stop, priority)
+                    self.cache.put(key, content, tokens=usage.get("total_tokens", 0))
+                    return content
+
+                # identical prompts sent concurrently by several workers only reach the API once, usage is only
+                # set for the caller that sent it
+                content = self._flight.do(key, create)
+        return (content, usage) if with_usage else content
+
+    def _create(self, messages, max_tokens, temperature, stop, priority):
+        openai = self.client()
+        tokens = self.budget.count_messages(messages) + max_tokens
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire(tokens, priority=priority)
+            try:
+                with self.inflight:
+                    response = openai.ChatCompletion.create(model=self.model_name, messages=messages, max_tokens=max_tokens, temperature=temperature, stop=stop)
+            except openai.error.OpenAIError as e:
+                if not self._retry(e, attempt):
+                    raise
+                continue
+            self.rate_limiter.on_success()
+            usage = response.get("usage", {})
+            self._account(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            return response["choices"][0]["message"]["content"], usage
+
+    def stream_request_to_api(self, messages, max_tokens=100, temperature=0.5, stop=None, use_cache=True,
+                              priority=RateLimiter.PRIORITY_NORMAL):
+        """Request a chat completion and yield its text as it is generated
+
+        A cached completion is yielded in one piece, a streamed completion is added to the cache once it is complete.
+        Rate limit and transient server errors are retried as long as no text has been yielded.
+
+        Args:
+            messages (list[dict]): Chat messages
+            max_tokens (int): Maximum number of completion tokens
+            temperature (float): Sampling temperature
+            stop (str|list): Stop sequence(s)
+            use_cache (bool): Set to False to always call the API
+            priority (int): Scheduling priority in the rate limiter, see RateLimiter
+
+        Yields:
+            str: Pieces of the completion text
+        """
+        key = None
+        if self.cache is not None and use_cache:
+            if not self.cache.is_cacheable(temperature):
+                self.cache.bypass()
+            else:
+                key = self.cache.key(self.model_name, messages, max_tokens, temperature, stop)
+                content = self.cache.get(key)
+                if content is not None:
+                    current_span().add("cache_hits")
+                    yield content
+                    return
+
+        openai = self.client()
+        tokens = self.budget.count_messages(messages) + max_tokens
+        parts = []
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire(tokens, priority=priority)
+            try:
+                with self.inflight:
+                    for chunk in openai.ChatCompletion.create(model=self.model_name, messages=messages, max_tokens=max_tokens,
+                                                              temperature=temperature, stop=stop, stream=True):
+                        delta = chunk["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+            except openai.error.OpenAIError as e:
+                # text already yielded cannot be taken back
+                if parts or not self._retry(e, attempt):
+                    raise
+                continue
+            self.rate_limiter.on_success()
+            break
+
+        # streamed responses carry no usage, count the tokens locally
+        content = "".join(parts)
+        prompt_tokens, completion_tokens = self.budget.count_messages(messages), self.budget.count(content)
+        self._account(prompt_tokens, completion_tokens)
+        if key is not None:
+            self.cache.put(key, content, tokens=prompt_tokens + completion_tokens)
+
+    def _retry(self, error, attempt):
+        """Wait before retrying a failed request, return False if it should not be retried
+
+        A 429 pauses every request through the rate limiter, a transient server error (5xx, timeout, lost
+        connection) only delays the failed request.
+        """
+        openai = self.client()
+        if isinstance(error, openai.error.RateLimitError):
+            self.rate_limiter.on_rate_limited(error.headers)
+            delay, reason = 0.0, "Rate limited"
+        elif self.is_transient(error):
+            delay, reason = self.rate_limiter.on_server_error(attempt, error.headers), type(error).__name__
+        else:
+            return False
+        if attempt == self.MAX_RATE_LIMIT_RETRIES:
+            return False
+        current_span().add("retries")
+        print(f"{reason}, retrying ({attempt+1}/{self.MAX_RATE_LIMIT_RETRIES})...")
+        time.sleep(delay)
+        return True
+
+    @classmethod
+    def is_transient(cls, error):
+        """Return True for errors worth retrying as is, server errors, timeouts and lost connections"""
+        openai = cls.client()
+        if isinstance(error, (openai.error.ServiceUnavailableError, openai.error.Timeout, openai.error.TryAgain,
+                              openai.error.APIConnectionError)):
+            return True
+        # errors raised while reading a response have no status
+        return isinstance(error, openai.error.APIError) and (error.http_status is None or error.http_status >= 500)
+
+    def _account(self, prompt_tokens, completion_tokens):
+        with self._usage_lock:
+            self._usage["calls"] += 1
+            self._usage["prompt_tokens"] += prompt_tokens
+            self._usage["completion_tokens"] += completion_tokens
+        span = current_span()
+        span.add("prompt_tokens", prompt_tokens)
+        span.add("completion_tokens", completion_tokens)
+
+    def usage(self):
+        """Return the number of API calls and the tokens they used, cache hits excluded"""
+        with self._usage_lock:
+            return dict(self._usage)
@@ -0,0 +1,136 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from osi.src.utils import cache_path, normalize_url
+
+class PageCache:
+    """Persistent cache of extracted page text, keyed by the hash of the normalized url.
+
+    Entries are stored in a SQLite file so they survive between research runs and can be shared by the
+    worker threads of one process (and by several processes). Entries older than the TTL are revalidated with
+    ETag/Last-Modified when the server provided them, and the least recently used entries are evicted once the
+    stored text exceeds the size cap.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, ttl=24*3600, max_bytes=256*1024*1024):
+        """
+        Args:
+            path (str): Location of the SQLite file, defaults to $OSI_CACHE_DIR/pages.sqlite
+            ttl (float): Seconds after which an entry has to be revalidated
+            max_bytes (int): Maximum total size of the stored text
+        """
+        if path is None:
+            path = cache_path("pages.sqlite")
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT PRIMARY KEY, url TEXT, text TEXT, etag TEXT, last_modified TEXT, "
+            "fetched_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages(accessed_at)")
+        self._db.commit()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide cache, creating it on first use"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+    def get(self, url):
+        """Look up a page
+
+        Args:
+            url (str): Page url
+
+        Returns:
+            dict: text, etag, last_modified and fresh, or None if the page is not cached
+        """
+        key = self.key(url)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT text, etag, last_modified, fetched_at FROM pages WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            text, etag, last_modified, fetched_at = row
+            fresh = now - fetched_at < self.ttl
+            if fresh:
+                self._stats["hits"] += 1
+                self._db.execute("UPDATE pages SET accessed_at=? WHERE key=?", (now, key))
+                self._db.commit()
+            else:
+                self._stats["stale"] += 1
+        return {"text": text, "etag": etag, "last_modified": last_modified, "fresh": fresh}
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Return the headers for revalidating a stale entry"""
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def revalidated(self, url):
+        """Mark a stale entry as fresh again after the server answered 304 Not Modified"""
+        now = time.time()
+        with self._lock:
+            self._stats["revalidated"] += 1
+            self._db.execute("UPDATE pages SET fetched_at=?, accessed_at=? WHERE key=?", (now, now, self.key(url)))
+            self._db.commit()
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """Store the extracted text of a page and evict old entries if the cache is over its size cap"""
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._stats["stores"] += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key(url), url, text, etag, last_modified, now, now, size),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM pages ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM pages WHERE key=?", (key,))
+            self._stats["evictions"] += 1
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM pages")
+            self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"], stats["bytes"] = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = (stats["hits"] + stats["revalidated"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,71 @@
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+from osi.src.TextExtractor import TextExtractor
+
+def extract_bytes(content, encoding, backend, main_content, max_chars):
+    """Decode an html body and extract its text, runs in a parse process
+
+    Only plain bytes and strings are passed in and out, so nothing but the page and its text crosses the
+    process boundary.
+    """
+    html = content.decode(encoding or "utf-8", errors="replace")
+    return TextExtractor(backend=backend, main_content=main_content).extract(html, max_chars=max_chars)
+
+
+class ParsePool:
+    """Process pool for the CPU-bound part of scraping.
+
+    Downloads stay on threads (or asyncio), which mostly wait for the network, while html parsing and text
+    cleanup run in separate processes and do not compete for the GIL. The calling thread blocks on the result,
+    so the scraper keeps its synchronous interface.
+    """
+    def __init__(self, max_workers=None):
+        """
+        Args:
+            max_workers (int): Number of parse processes, the number of CPUs if None
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # spawned processes do not inherit the locks held by the fetching threads at fork time
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Lock()
+        self._stats = {"pages": 0, "bytes_in": 0, "chars_out": 0}
+
+    def submit(self, content, encoding, extractor, max_chars=None):
+        """Schedule the extraction of an html body
+
+        Args:
+            content (bytes): Raw response body
+            encoding (str): Charset of the body
+            extractor (TextExtractor): Backend and mode to use in the parse process
+            max_chars (int): Truncate the text to this many characters
+
+        Returns:
+            concurrent.futures.Future: Future of the extracted text
+        """
+        with self._lock:
+            self._stats["pages"] += 1
+            self._stats["bytes_in"] += len(content)
+        future = self._executor.submit(extract_bytes, content, encoding, extractor.backend, extractor.main_content, max_chars)
+        future.add_done_callback(self._count_output)
+        return future
+
+    def extract(self, content, encoding, extractor, max_chars=None):
+        """Blocking version of submit, returns the extracted text"""
+        return self.submit(content, encoding, extractor, max_chars).result()
+
+    def _count_output(self, future):
+        if not future.cancelled() and future.exception() is None:
+            with self._lock:
+                self._stats["chars_out"] += len(future.result())
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["processes"] = self.max_workers
+        return stats
@@ -0,0 +1,116 @@
+import re
+from collections import Counter
+
+class PassageRanker:
+    """Local BM25 ranking of passages and pages against a task.
+
+    Long pages are split into passages of a few sentences, every passage is scored against the task and the search
+    query, and the best passages are packed into the token budget in their original order. This replaces cutting
+    the page after its first few thousand characters, so the relevant part of a long page reaches the model.
+    Scoring is vectorized with NumPy and needs no network.
+    """
+    WORD = re.compile(r"\w+")
+    SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+    GAP = " [...] "
+
+    def __init__(self, passage_words=120, k1=1.5, b=0.75):
+        """
+        Args:
+            passage_words (int): Approximate number of words per passage
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalization
+        """
+        self.passage_words = passage_words
+        self.k1 = k1
+        self.b = b
+
+    def tokenize(self, text):
+        return self.WORD.findall(text.lower())
+
+    def split(self, text):
+        """Split a text into passages of whole sentences with about passage_words words each"""
+        passages, current, n_words = [], [], 0
+        for sentence in self.SENTENCE_END.split(text):
+            current.append(sentence)
+            n_words += sentence.count(" ") + 1
+            if n_words >= self.passage_words:
+                passages.append(" ".join(current))
+                current, n_words = [], 0
+        if current:
+            passages.append(" ".join(current))
+        return passages
+
+    def score(self, query, documents):
+        """BM25 score of every document for the query, document frequencies are taken from the documents themselves
+
+        Args:
+            query (str): Task and search query
+            documents (list[str]): Passages or pages
+
+        Returns:
+            numpy.ndarray: One score per document
+        """
+        import numpy as np
+
+        terms = sorted(set(self.tokenize(query)))
+        if not terms or not documents:
+            return np.zeros(len(documents))
+        index = {term: i for i, term in enumerate(terms)}
+        tf = np.zeros((len(documents), len(terms)))
+        lengths = np.zeros(len(documents))
+        for row, document in enumerate(documents):
+            tokens = self.tokenize(document)
+            lengths[row] = len(tokens)
+            for term, count in Counter(token for token in tokens if token in index).items():
+                tf[row, index[term]] = count
+
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(documents) - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        return (idf * tf * (self.k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+    def select(self, query, text, budget, max_tokens):
+        """Pack the passages most relevant to the query into max_tokens
+
+        Args:
+            query (str): Task and search query
+            text (str): Page text
+            budget (TokenBudget): Token counter of the model
+            max_tokens (int): Tokens available for the text
+
+        Returns:
+            str: The text itself if it fits, else its best passages in document order separated by GAP
+        """
+        if max_tokens <= 0 or budget.count(text) <= max_tokens:
+            return text
+        passages = self.split(text)
+        scores = self.score(query, passages)
+        if not scores.any():
+            # nothing matches the query, the head of the page is as good as any other part
+            return budget.trim(text, max_tokens)
+
+        selected, used = {}, 0
+        # best score first, earlier passages win ties
+        for i in sorted(range(len(passages)), key=lambda i: (-scores[i], i)):
+            cost = budget.count(passages[i] + self.GAP)
+            if used + cost <= max_tokens:
+                selected[i] = passages[i]
+                used += cost
+            elif not selected:
+                # the best passage alone is too long, keep as much of it as fits
+                selected[i] = budget.trim(passages[i], max_tokens - budget.count(self.GAP))
+                used += budget.count(selected[i] + self.GAP)
+        return self.GAP.join(selected[i] for i in sorted(selected))
+
+    def rank_pages(self, query, pages):
+        """Order pages by relevance to the query
+
+        Args:
+            query (str): Task
+            pages (list[str]): Page texts
+
+        Returns:
+            list[int]: Indices of the pages, most relevant first
+        """
+        scores = self.score(query, pages)
+        return sorted(range(len(pages)), key=lambda i: (-scores[i], i))
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import random
+import heapq
+import itertools
+import threading
+
+class RateLimiter:
+    """Process-wide scheduler for OpenAI requests.
+
+    Enforces a requests-per-minute and a tokens-per-minute budget with two token buckets shared by every
+    OpenAICaller. Waiting requests are served by priority, then in arrival order. When the API answers 429 the
+    limiter pauses all requests (honouring the rate-limit headers if present) and lowers its effective rate,
+    which then recovers with every successful request. Transient server errors only delay the failed request.
+    """
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, requests_per_minute=3500, tokens_per_minute=90000, max_backoff=60.0, server_error_backoff=0.5):
+        """
+        Args:
+            requests_per_minute (int): Request budget
+            tokens_per_minute (int): Token budget (prompt plus max_tokens of every request)
+            max_backoff (float): Upper bound in seconds for an adaptive pause after a 429
+            server_error_backoff (float): Delay in seconds before the first retry after a server error, doubled with every attempt
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_backoff = max_backoff
+        self.server_error_backoff = server_error_backoff
+
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._rate_factor = 1.0
+        self._backoff = 1.0
+        self._stats = {"requests": 0, "tokens": 0, "rate_limited": 0, "server_errors": 0, "waited_seconds": 0.0}
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide limiter, budgets are read from OSI_REQUESTS_PER_MINUTE and OSI_TOKENS_PER_MINUTE"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(requests_per_minute=int(os.getenv("OSI_REQUESTS_PER_MINUTE", 3500)),
+                                      tokens_per_minute=int(os.getenv("OSI_TOKENS_PER_MINUTE", 90000)))
+        return cls._shared
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60 * self._rate_factor)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60 * self._rate_factor)
+        return now
+
+    def _wait_time(self, now, tokens):
+        """Seconds until both buckets can serve a request of the given size"""
+        wait = max(0.0, self._paused_until - now)
+        if self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / (self.requests_per_minute * self._rate_factor))
+        if self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / (self.tokens_per_minute * self._rate_factor))
+        return wait
+
+    def acquire(self, tokens, priority=PRIORITY_NORMAL):
+        """Block until the request fits into the budget
+
+        Args:
+            tokens (int): Tokens the request may consume
+            priority (int): PRIORITY_HIGH or PRIORITY_NORMAL
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        entry = (priority, next(self._sequence))
+        started_at = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = self._refill()
+                    wait = self._wait_time(now, tokens)
+                    if self._waiters[0] == entry and wait == 0:
+                        heapq.heappop(self._waiters)
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        self._stats["requests"] += 1
+                        self._stats["tokens"] += tokens
+                        self._stats["waited_seconds"] += now - started_at
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(timeout=max(wait, 0.01))
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._condition.notify_all()
+                raise
+
+    def on_success(self):
+        """Slowly restore the full rate after a period of 429s"""
+        with self._condition:
+            self._rate_factor = min(1.0, self._rate_factor + 0.05)
+            self._backoff = max(1.0, self._backoff / 2)
+
+    def on_rate_limited(self, headers=None):
+        """Pause all requests after a 429 and lower the effective rate
+
+        Args:
+            headers (dict): Response headers of the failed request, if available
+        """
+        delay = self._delay_from_headers(headers or {})
+        with self._condition:
+            self._stats["rate_limited"] += 1
+            if delay is None:
+                delay = self._backoff
+                self._backoff = min(self.max_backoff, self._backoff * 2)
+            self._rate_factor = max(0.1, self._rate_factor / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+
+    def on_server_error(self, attempt, headers=None):
+        """Return how long to wait before retrying a request that failed with a transient server error
+
+        The error says nothing about the quota, so other requests are neither paused nor slowed down.
+
+        Args:
+            attempt (int): Number of earlier retries of the request
+            headers (dict): Response headers of the failed request, if available
+
+        Returns:
+            float: Delay in seconds, with jitter so that failed requests do not retry in lockstep
+        """
+        with self._condition:
+            self._stats["server_errors"] += 1
+        delay = self._delay_from_headers(headers or {})
+        if delay is None:
+            delay = min(self.max_backoff, self.server_error_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return delay
+
+    @classmethod
+    def _delay_from_headers(cls, headers):
+        headers = {key.lower(): value for key, value in headers.items()}
+        if headers.get("retry-after", "").replace(".", "", 1).isdigit():
+            return float(headers["retry-after"])
+        delays = [cls._parse_duration(headers[key]) for key in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens") if key in headers]
+        delays = [delay for delay in delays if delay is not None]
+        return max(delays) if delays else None
+
+    @staticmethod
+    def _parse_duration(value):
+        """Parse durations such as '20ms', '1.5s' or '6m0s'"""
+        units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+        parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+        if not parts:
+            return None
+        return sum(float(number) * units[unit] for number, unit in parts)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["rate_factor"] = self._rate_factor
+            stats["queued"] = len(self._waiters)
+        return stats
@@ -0,0 +1,40 @@
+class RetryPolicy:
+    """Limits for the self-check retries of a Worker task.
+
+    A task is retried while its report fails the self-check, until one of the limits is reached.
+    """
+    PASSED = "passed"
+    MAX_ATTEMPTS = "max_attempts"
+    TIME_BUDGET = "time_budget"
+    TOKEN_BUDGET = "token_budget"
+
+    def __init__(self, max_attempts=3, max_seconds=None, max_tokens=None):
+        """
+        Args:
+            max_attempts (int): Maximum number of protocol reports generated for a task
+            max_seconds (float): No retry is started once the task has run for this many seconds
+            max_tokens (int): No retry is started once the task has used this many tokens
+        """
+        self.max_attempts = max_attempts
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+
+    def exhausted(self, state):
+        """Return the reason why no further attempt is allowed, or None
+
+        Args:
+            state (TaskState): State of the task
+
+        Returns:
+            str: MAX_ATTEMPTS, TIME_BUDGET, TOKEN_BUDGET or None
+        """
+        if state.n_attempts >= self.max_attempts:
+            return self.MAX_ATTEMPTS
+        if self.max_seconds is not None and state.duration is not None and state.duration >= self.max_seconds:
+            return self.TIME_BUDGET
+        if self.max_tokens is not None and state.tokens_used >= self.max_tokens:
+            return self.TOKEN_BUDGET
+        return None
+
+    def __repr__(self):
+        return f"RetryPolicy(max_attempts={self.max_attempts}, max_seconds={self.max_seconds}, max_tokens={self.max_tokens})"
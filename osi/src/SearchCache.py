@@ -0,0 +1,113 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from osi.src.SingleFlight import SingleFlight
+from osi.src.utils import cache_path
+
+class SearchCache:
+    """Cache of search engine results keyed by (engine, normalized query, num_results).
+
+    Results live in memory and are optionally persisted to SQLite so they survive between runs. Identical
+    queries issued concurrently by several Workers are coalesced into a single call to the search engine.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl=6*3600, path=None):
+        """
+        Args:
+            ttl (float): Seconds a search result stays valid
+            path (str): SQLite file to persist the results to, results are kept in memory only if None
+        """
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._flight = SingleFlight()
+        self._stats = {"hits": 0, "misses": 0}
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, urls TEXT, stored_at REAL)")
+            self._db.commit()
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide cache persisted to $OSI_CACHE_DIR/searches.sqlite, creating it on first use"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(path=cache_path("searches.sqlite"))
+        return cls._shared
+
+    @staticmethod
+    def normalize_query(query):
+        """Normalize a query so that trivially different spellings share a cache entry"""
+        query = query.strip().strip("'\"").casefold()
+        return re.sub(r"\s+", " ", query)
+
+    def key(self, engine, query, num_results):
+        return f"{engine}|{self.normalize_query(query)}|{num_results}"
+
+    def get(self, engine, query, num_results):
+        """Return the cached urls or None"""
+        key = self.key(engine, query, num_results)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT urls, stored_at FROM searches WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._memory[key] = entry
+            if entry is not None and now - entry[1] < self.ttl:
+                self._stats["hits"] += 1
+                return list(entry[0])
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, engine, query, num_results, urls):
+        key = self.key(engine, query, num_results)
+        now = time.time()
+        with self._lock:
+            self._memory[key] = (list(urls), now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (key, json.dumps(urls), now))
+                self._db.commit()
+
+    def get_or_search(self, engine, query, num_results, search_fn):
+        """Return cached urls, or run search_fn once for all concurrent callers and cache its result
+
+        Args:
+            engine (str): Search engine name
+            query (str): Search query
+            num_results (int): Number of requested results
+            search_fn (callable): Function without arguments returning the list of urls
+
+        Returns:
+            list[str]: urls
+        """
+        urls = self.get(engine, query, num_results)
+        if urls is not None:
+            return urls
+
+        def search():
+            urls = search_fn()
+            # empty results are usually a transient failure, do not cache them
+            if urls:
+                self.put(engine, query, num_results, urls)
+            return urls
+
+        return list(self._flight.do(self.key(engine, query, num_results), search))
+
+    def stats(self):
+        """Return hit/miss counters and the number of coalesced in-flight queries"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+        stats["coalesced"] = self._flight.coalesced
+        return stats
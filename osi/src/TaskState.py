@@ -0,0 +1,71 @@
+import time
+import threading
+
+class TaskState:
+    """Mutable state of one research subtask.
+
+    Holds everything that changes while a Worker processes a task (correction prompt, retry flag, attempt
+    counter) so that one Worker can run several tasks concurrently without them interfering, plus the
+    scheduling outcome (status, result, error, timing) reported back by the Orchestrator.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
+
+    def __init__(self, task, cancel_event=None, deduplicator=None, artifacts=None):
+        """
+        Args:
+            task (str): The subtask
+            cancel_event (threading.Event): Event that cancels the task when set, e.g. shared by a whole run
+            deduplicator (Deduplicator): Duplicate detection shared by a whole run, the task dedups on its own if None
+            artifacts (RunArtifacts): Checkpoints of the run, the task is not checkpointed if None
+        """
+        self.task = task
+        self.cancel_event = cancel_event or threading.Event()
+        self.deduplicator = deduplicator
+        self.artifacts = artifacts
+        # (summary, source links) of similar past subtasks, used as summaries of the task
+        self.seeds = []
+        self.correction_prompt = []
+        self.redo_task = True
+        self.n_attempts = 0
+        self.tokens_used = 0
+        self.retry_outcome = None
+        self.status = self.PENDING
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def add_tokens(self, tokens):
+        """Account tokens spent on the task, safe to call from several threads"""
+        with self._lock:
+            self.tokens_used += tokens
+
+    def start(self):
+        self.status = self.RUNNING
+        if self.started_at is None:
+            self.started_at = time.time()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+
+    def __repr__(self):
+        return f"TaskState(task={self.task!r}, status={self.status!r}, n_attempts={self.n_attempts}, retry_outcome={self.retry_outcome!r})"
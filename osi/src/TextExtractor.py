@@ -0,0 +1,294 @@
+from html.parser import HTMLParser
+
+class ParagraphCollector:
+    """Collects the text of <p> elements from a stream of start/end/data events.
+
+    The same collector is driven by every parser backend (lxml, html.parser, BeautifulSoup), so all backends
+    apply the same rules. In main_content mode, navigation, footers, cookie banners and similar boilerplate
+    are skipped, as well as very short or link-heavy paragraphs. If that leaves nothing, the text of all
+    paragraphs is returned instead.
+    """
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+    # a paragraph ends where one of these starts or ends, as html allows the </p> to be left out
+    BLOCK_TAGS = frozenset((
+        "p", "address", "article", "aside", "blockquote", "details", "dialog", "div", "dl", "dd", "dt", "fieldset",
+        "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hgroup", "hr", "li",
+        "main", "menu", "nav", "ol", "pre", "section", "table", "td", "th", "tr", "ul",
+    ))
+    # page containers are never boilerplate, whatever their classes say
+    CONTAINER_TAGS = {"html", "body", "main", "article"}
+    BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "dialog", "button"}
+    BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog"}
+    # whole id and class names, "sidebar" is boilerplate but "no-sidebar" or "sidebar-open" are not
+    BOILERPLATE_NAMES = frozenset((
+        "cookie", "cookies", "cookie-banner", "cookie-consent", "cookie-notice", "consent", "gdpr", "banner",
+        "footer", "site-footer", "nav", "navbar", "navigation", "site-navigation", "menu", "main-menu", "sidebar",
+        "share", "sharing", "share-buttons", "social", "social-share", "subscribe", "newsletter", "advert",
+        "advertisement", "ad", "ads", "promo", "related", "related-posts", "comments", "comment-list", "popup",
+        "modal", "breadcrumb", "breadcrumbs",
+    ))
+
+    def __init__(self, main_content=False, min_words=5, max_link_density=0.5):
+        """
+        Args:
+            main_content (bool): Skip boilerplate elements and paragraphs
+            min_words (int): Shorter paragraphs are dropped in main_content mode
+            max_link_density (float): Paragraphs with a larger share of link text are dropped in main_content mode
+        """
+        self.main_content = main_content
+        self.min_words = min_words
+        self.max_link_density = max_link_density
+        self.paragraphs = []
+        self.n_chars = 0
+        # every paragraph, returned in main_content mode when no paragraph passed the filters
+        self.fallback = []
+        self._current = None
+        self._link_chars = 0
+        self._in_paragraph = False
+        self._link_depth = 0
+        self._skip = None
+        self._boilerplate = None
+
+    def is_boilerplate(self, tag, attrs):
+        if tag in self.CONTAINER_TAGS:
+            return False
+        if tag in self.BOILERPLATE_TAGS or (attrs.get("role") or "").lower() in self.BOILERPLATE_ROLES:
+            return True
+        names = f"{attrs.get('id') or ''} {attrs.get('class') or ''}".lower().split()
+        return not self.BOILERPLATE_NAMES.isdisjoint(names)
+
+    def start(self, tag, attrs):
+        if self._skip is not None:
+            # only the tag that opened the skipped region matters for finding its end
+            if tag == self._skip[0]:
+                self._skip[1] += 1
+            return
+        if self._in_paragraph and tag in self.BLOCK_TAGS:
+            self._end_paragraph()
+        if tag in self.SKIPPED_TAGS:
+            self._skip = [tag, 1]
+            return
+        if self._boilerplate is not None:
+            if tag == self._boilerplate[0]:
+                self._boilerplate[1] += 1
+        elif self.main_content and self.is_boilerplate(tag, attrs):
+            # paragraphs inside are still collected for the fallback
+            self._boilerplate = [tag, 1]
+        if tag == "p":
+            self._in_paragraph = True
+            self._current = []
+            self._link_chars = 0
+        elif tag == "a" and self._in_paragraph:
+            self._link_depth += 1
+
+    def end(self, tag):
+        if self._skip is not None:
+            if tag == self._skip[0]:
+                self._skip[1] -= 1
+                if self._skip[1] == 0:
+                    self._skip = None
+            return
+        if self._in_paragraph and tag in self.BLOCK_TAGS:
+            self._end_paragraph()
+        elif tag == "a" and self._link_depth > 0:
+            self._link_depth -= 1
+        if self._boilerplate is not None and tag == self._boilerplate[0]:
+            self._boilerplate[1] -= 1
+            if self._boilerplate[1] == 0:
+                self._boilerplate = None
+
+    def data(self, data):
+        if self._in_paragraph and self._skip is None:
+            self._current.append(data)
+            if self._link_depth > 0:
+                self._link_chars += len(data)
+
+    def close(self):
+        # an unterminated paragraph at the end of a truncated download still counts
+        if self._in_paragraph:
+            self._end_paragraph()
+        return self.text
+
+    def _end_paragraph(self):
+        paragraph = "".join(self._current)
+        self._in_paragraph = False
+        self._current = None
+        self._link_depth = 0
+        if not paragraph.strip():
+            return
+        if self.main_content:
+            words = paragraph.split()
+            paragraph = " ".join(words)
+            if paragraph:
+                self.fallback.append(paragraph)
+            if (self._boilerplate is not None or len(words) < self.min_words
+                    or self._link_chars > self.max_link_density * len(paragraph)):
+                return
+        self.paragraphs.append(paragraph)
+        self.n_chars += len(paragraph) + 1
+
+    @property
+    def text(self):
+        return " ".join(self.paragraphs or self.fallback)
+
+
+class ParagraphParser(HTMLParser):
+    """Incremental html parser collecting the text of <p> elements, pure Python (html.parser) backend.
+
+    Chunks of the document are passed to feed() as they arrive, so the download can stop as soon as
+    enough text has been collected.
+    """
+    def __init__(self, main_content=False):
+        super().__init__(convert_charrefs=True)
+        self.collector = ParagraphCollector(main_content=main_content)
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def close(self):
+        super().close()
+        self.collector.close()
+
+    @property
+    def paragraphs(self):
+        return self.collector.paragraphs or self.collector.fallback
+
+    @property
+    def n_chars(self):
+        return self.collector.n_chars
+
+    @property
+    def text(self):
+        return self.collector.text
+
+
+class LxmlParagraphParser:
+    """Incremental paragraph parser on top of the lxml (libxml2) html parser, same interface as ParagraphParser"""
+    def __init__(self, main_content=False):
+        from lxml import etree
+        self.collector = ParagraphCollector(main_content=main_content)
+        self._parser = etree.HTMLParser(target=self.collector)
+        self._fed = False
+
+    def feed(self, data):
+        if data:
+            self._parser.feed(data)
+            self._fed = True
+
+    def close(self):
+        # lxml refuses to close a parser that never received any data
+        if self._fed:
+            self._parser.close()
+
+    @property
+    def paragraphs(self):
+        return self.collector.paragraphs or self.collector.fallback
+
+    @property
+    def n_chars(self):
+        return self.collector.n_chars
+
+    @property
+    def text(self):
+        return self.collector.text
+
+
+class SoupParagraphParser:
+    """BeautifulSoup fallback, buffers the document and parses it on close, same interface as ParagraphParser"""
+    def __init__(self, main_content=False):
+        self.collector = ParagraphCollector(main_content=main_content)
+        self._chunks = []
+
+    def feed(self, data):
+        self._chunks.append(data)
+
+    def close(self):
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup("".join(self._chunks), "html.parser")
+        self._walk(soup)
+        self.collector.close()
+
+    def _walk(self, node):
+        from bs4 import Comment, NavigableString, Tag
+        for child in node.children:
+            if isinstance(child, Tag):
+                attrs = {key: " ".join(value) if isinstance(value, list) else value for key, value in child.attrs.items()}
+                self.collector.start(child.name, attrs)
+                self._walk(child)
+                self.collector.end(child.name)
+            elif isinstance(child, NavigableString) and not isinstance(child, Comment):
+                self.collector.data(str(child))
+
+    @property
+    def paragraphs(self):
+        return self.collector.paragraphs or self.collector.fallback
+
+    @property
+    def n_chars(self):
+        return self.collector.n_chars
+
+    @property
+    def text(self):
+        return self.collector.text
+
+
+class TextExtractor:
+    """Pluggable extraction of the readable text of an html page.
+
+    Backends:
+        "lxml": libxml2 based parser, fast, the default when lxml is installed
+        "html.parser": pure Python parser from the standard library
+        "bs4": BeautifulSoup with html.parser, the original implementation
+    """
+    BACKENDS = {
+        "lxml": LxmlParagraphParser,
+        "html.parser": ParagraphParser,
+        "bs4": SoupParagraphParser,
+    }
+
+    def __init__(self, backend=None, main_content=False):
+        """
+        Args:
+            backend (str): One of BACKENDS, the fastest available backend if None
+            main_content (bool): Drop navigation, footers, cookie banners and other boilerplate
+        """
+        self.backend = backend or self.default_backend()
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"Invalid backend: {self.backend}")
+        self.main_content = main_content
+
+    @staticmethod
+    def default_backend():
+        try:
+            import lxml.etree
+            return "lxml"
+        except ImportError:
+            return "html.parser"
+
+    def parser(self):
+        """Return a new incremental parser with feed(), close(), n_chars and text"""
+        return self.BACKENDS[self.backend](main_content=self.main_content)
+
+    def extract(self, html, max_chars=None):
+        """Extract the paragraph text of a complete html document
+
+        Args:
+            html (str): The document
+            max_chars (int): Truncate the text to this many characters
+
+        Returns:
+            str: The extracted text
+        """
+        parser = self.parser()
+        parser.feed(html)
+        parser.close()
+        return parser.text[:max_chars] if max_chars else parser.text
+
+    def __repr__(self):
+        return f"TextExtractor(backend={self.backend!r}, main_content={self.main_content})"
@@ -0,0 +1,164 @@
+import re
+import functools
+
+class TokenBudget:
+    """Token accounting for chat prompts.
+
+    Counts tokens with the model's tiktoken encoding and allocates the context window between the system prompt,
+    the correction prompt, the fixed part of the user message and the completion. Only the payload (page text,
+    summaries, report) is trimmed, at a sentence boundary. When tiktoken or its encoding files are not available
+    (e.g. offline without a warm cache) a conservative character-based estimate is used instead.
+    """
+    CONTEXT_WINDOWS = {
+        "gpt-3.5-turbo": 4096,
+        "gpt-3.5-turbo-16k": 16384,
+        "gpt-4": 8192,
+        "gpt-4-32k": 32768,
+        "gpt-4-turbo": 128000,
+        "gpt-4o": 128000,
+    }
+    MESSAGE_OVERHEAD = 4
+    REPLY_OVERHEAD = 3
+    CHARS_PER_TOKEN = 3.0
+    # token counts of this many distinct system prompts are kept
+    MAX_SYSTEM_PROMPTS = 64
+    SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+    def __init__(self, model_name, context_window=None, max_correction_share=0.3):
+        """
+        Args:
+            model_name (str): Model the prompts are sent to
+            context_window (int): Size of the context window, looked up from the model name if None
+            max_correction_share (float): Maximum share of the window the correction prompt may use
+        """
+        self.model_name = model_name
+        self.context_window = context_window or self.lookup_context_window(model_name)
+        self.max_correction_share = max_correction_share
+        self._system_tokens = {}
+
+    @property
+    def encoder(self):
+        # loading an encoding may hit the network on a cold tiktoken cache, so it happens on first use
+        return self.get_encoder(self.model_name)
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def for_model(cls, model_name):
+        """Return a shared budget for the model"""
+        return cls(model_name)
+
+    @classmethod
+    def lookup_context_window(cls, model_name):
+        matches = [name for name in cls.CONTEXT_WINDOWS if model_name.startswith(name)]
+        if not matches:
+            return 4096
+        return cls.CONTEXT_WINDOWS[max(matches, key=len)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_encoder(model_name):
+        """Load the tiktoken encoding for a model once, None if it cannot be loaded"""
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            pass
+        except Exception:
+            return None
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+    def count(self, text):
+        """Number of tokens in a text"""
+        if self.encoder is None:
+            return int(len(text) / self.CHARS_PER_TOKEN) + 1
+        return len(self.encoder.encode(text, disallowed_special=()))
+
+    def _count_system(self, text):
+        # system prompts are a few fixed templates counted for every request, the other messages are seldom repeated
+        tokens = self._system_tokens.get(text)
+        if tokens is None:
+            if len(self._system_tokens) >= self.MAX_SYSTEM_PROMPTS:
+                self._system_tokens.clear()
+            tokens = self._system_tokens[text] = self.count(text)
+        return tokens
+
+    def count_messages(self, messages):
+        """Number of prompt tokens a list of chat messages uses, including the per-message overhead"""
+        return sum((self._count_system(message["content"]) if message["role"] == "system" else self.count(message["content"]))
+                   + self.MESSAGE_OVERHEAD for message in messages) + self.REPLY_OVERHEAD
+
+    def trim(self, text, max_tokens):
+        """Trim a text to at most max_tokens tokens, cutting at the last sentence boundary that fits
+
+        Args:
+            text (str): Text to trim
+            max_tokens (int): Token limit
+
+        Returns:
+            str: The text, or its longest prefix ending at a sentence boundary that fits the limit
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        if self.encoder is None:
+            prefix = text[:int(max_tokens * self.CHARS_PER_TOKEN)]
+        else:
+            prefix = self.encoder.decode(self.encoder.encode(text, disallowed_special=())[:max_tokens])
+
+        # prefer the end of a sentence, fall back to a word boundary if the last sentence is very long
+        boundaries = [match.start() for match in self.SENTENCE_END.finditer(prefix)]
+        if boundaries and boundaries[-1] >= len(prefix) // 2:
+            return prefix[:boundaries[-1]]
+        word_boundary = prefix.rfind(" ")
+        if word_boundary > 0:
+            return prefix[:word_boundary]
+        return prefix
+
+    def build_messages(self, system, prefix, payload="", max_tokens=500, correction_prompt=None):
+        """Build chat messages that fit into the context window together with the completion
+
+        The system prompt and the prefix of the user message are kept as is, the correction prompt is limited to
+        max_correction_share of the window, and the payload gets whatever room remains.
+
+        Args:
+            system (str): System prompt, omitted if None
+            prefix (str): Fixed part of the user message (task, source link, instructions)
+            payload (str): Variable part of the user message, trimmed to fit
+            max_tokens (int): Tokens reserved for the completion
+            correction_prompt (list[dict]): Messages inserted between the system prompt and the user message
+
+        Returns:
+            list[dict]: chat messages
+        """
+        messages = self._head(system, correction_prompt)
+        payload = self.trim(payload, self._available(messages, prefix, max_tokens))
+        messages.append({"role": "user", "content": prefix + payload})
+        return messages
+
+    def payload_budget(self, system, prefix, max_tokens=500, correction_prompt=None):
+        """Number of tokens build_messages leaves for the payload, same arguments as build_messages"""
+        return self._available(self._head(system, correction_prompt), prefix, max_tokens)
+
+    def _head(self, system, correction_prompt):
+        """System prompt and correction prompt, the latter limited to max_correction_share of the window"""
+        messages = [{"role": "system", "content": system}] if system is not None else []
+
+        correction_budget = int(self.context_window * self.max_correction_share)
+        for message in correction_prompt or []:
+            content = self.trim(message["content"], correction_budget - self.MESSAGE_OVERHEAD)
+            correction_budget -= self.count(content) + self.MESSAGE_OVERHEAD
+            messages.append({"role": message["role"], "content": content})
+        return messages
+
+    def _available(self, messages, prefix, max_tokens):
+        available = self.context_window - max_tokens - self.count_messages(messages + [{"role": "user", "content": prefix}])
+        # the token counts of prefix and payload are not exactly additive at the seam, keep a small margin
+        return available - 2
@@ -0,0 +1,248 @@
+import os
+import json
+import functools
+import time
+import itertools
+import threading
+import contextvars
+from collections import defaultdict
+from osi.src.LatencyTracker import LatencyTracker
+
+_current_span = contextvars.ContextVar("osi_current_span", default=None)
+
+
+class Span:
+    """A timed pipeline stage with free-form attributes.
+
+    Used as a context manager, the span becomes the current span of its context, so code further down the call
+    stack (HttpClient, OpenAICaller) can add counters to it through current_span() without knowing the tracer.
+    """
+    __slots__ = ("tracer", "name", "span_id", "parent_id", "thread_id", "start", "duration", "attributes", "activate", "_started", "_token")
+
+    def __init__(self, tracer, name, parent_id, attributes, activate=True):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent_id
+        self.thread_id = threading.get_ident()
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self.activate = activate
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, value=1):
+        """Increment a numeric attribute, e.g. bytes, prompt_tokens or retries"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.attributes["error"] = type(error).__name__
+        else:
+            self.tracer.latency.record(self.name, self.duration)
+        self.tracer._record(self)
+
+    def __enter__(self):
+        if self.activate:
+            self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # entered and exited in different contexts
+                _current_span.set(None)
+        self.finish(exc)
+        return False
+
+    def to_dict(self):
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id, "thread_id": self.thread_id,
+                "start": self.start, "duration": self.duration, **self.attributes}
+
+
+class _TimedSpan:
+    """Stands in for a span when tracing is disabled, only its duration is recorded in the tracer's latencies"""
+    __slots__ = ("latency", "name", "_started")
+
+    def __init__(self, latency, name):
+        self.latency = latency
+        self.name = name
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+    def finish(self, error=None):
+        if self._started is None:
+            return
+        if error is None:
+            self.latency.record(self.name, time.perf_counter() - self._started)
+        self._started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.finish(exc)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is disabled, every operation does nothing"""
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """Return the span of the current context, a no-op span if there is none"""
+    return _current_span.get() or NOOP_SPAN
+
+
+class Tracer:
+    """Collects spans of the research pipeline.
+
+    The duration of every span that finishes without an error goes into latency, which gives the p50/p95/p99 of
+    each stage. When disabled, span() returns a small object that only records that duration, and no spans or
+    counters are kept.
+    Finished spans can be exported as JSON lines or in the Chrome trace event format (chrome://tracing, Perfetto)
+    and summarized per stage. The context (and therefore the parent span) follows calls made through
+    utils.to_thread.
+    """
+    COUNTERS = ("bytes", "prompt_tokens", "completion_tokens", "cache_hits", "retries")
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, enabled=True, max_spans=100000, latency=None):
+        """
+        Args:
+            enabled (bool): Record spans
+            max_spans (int): Spans beyond this number are dropped
+            latency (LatencyTracker): Receives the duration of every stage, a new tracker if None
+        """
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.latency = latency or LatencyTracker()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spans = []
+        self.dropped = 0
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide tracer, enabled if OSI_TRACE is set to a non-empty value other than 0"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(enabled=os.getenv("OSI_TRACE", "0") not in ("", "0"))
+        return cls._shared
+
+    def span(self, name, activate=True, **attributes):
+        """Start a span, use it as a context manager or call finish() on it
+
+        Args:
+            name (str): Stage name
+            activate (bool): Make the span the parent of spans started within the with block. Pass False for spans
+                held across the yields of a generator
+            **attributes: Initial attributes
+
+        Returns:
+            Span: the span, or one that only measures the stage if tracing is disabled
+        """
+        if not self.enabled:
+            return _TimedSpan(self.latency, name)
+        parent = _current_span.get()
+        return Span(self, name, parent.span_id if parent is not None else None, attributes, activate=activate)
+
+    def _record(self, span):
+        with self._lock:
+            if len(self._spans) < self.max_spans:
+                self._spans.append(span)
+            else:
+                self.dropped += 1
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans = []
+            self.dropped = 0
+
+    def export_jsonl(self, path):
+        """Write one JSON object per finished span"""
+        with open(path, "w", encoding="utf-8") as f:
+            for span in self.spans():
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def export_chrome(self, path):
+        """Write the spans in the Chrome trace event format, one track per thread"""
+        events = [{"name": span.name, "ph": "X", "ts": span.start * 1e6, "dur": span.duration * 1e6, "pid": os.getpid(),
+                   "tid": span.thread_id, "args": {"span_id": span.span_id, "parent_id": span.parent_id, **span.attributes}}
+                  for span in self.spans()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def stats(self):
+        """Aggregate the spans per stage: count, total and max duration and the sums of the counters"""
+        stats = defaultdict(lambda: dict({"count": 0, "total": 0.0, "max": 0.0}, **{counter: 0 for counter in self.COUNTERS}))
+        for span in self.spans():
+            entry = stats[span.name]
+            entry["count"] += 1
+            entry["total"] += span.duration
+            entry["max"] = max(entry["max"], span.duration)
+            for counter in self.COUNTERS:
+                entry[counter] += span.attributes.get(counter, 0)
+        return dict(stats)
+
+    def summary(self):
+        """Format the per-stage latency percentiles and statistics as a table"""
+        lines = [f"{'stage':<24} {'count':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'total s':>8} "
+                 f"{'bytes':>10} {'prompt':>8} {'compl.':>7} {'hits':>5} {'retries':>7}"]
+        for name, entry in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+            percentiles = self.latency.percentiles(name) or {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+            lines.append(f"{name:<24} {entry['count']:>6} " + " ".join(f"{percentiles[key] * 1000:>7.0f}" for key in ("p50", "p95", "p99"))
+                         + f" {entry['max'] * 1000:>7.0f} {entry['total']:>8.2f} {entry['bytes']:>10} {entry['prompt_tokens']:>8} "
+                         f"{entry['completion_tokens']:>7} {entry['cache_hits']:>5} {entry['retries']:>7}")
+        return "\n".join(lines)
+
+
+def traced(name):
+    """Decorator running a method in a span of self.tracer"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,13 +1,112 @@
+import re
+from osi.src.utils import canonicalize_url
+
 class Validator:
     """This class will validate the communications between the Orchestrator and Workers, ensuring that they follow the defined protocol
+
+    Reports are checked locally against the IAIA structure of Worker.PROTOCOL_FORMAT: every section present, in
+    order and not empty, the length limit, and source links that point to pages which were actually scraped. The
+    checks are a few compiled regular expressions, so they cost microseconds instead of an LLM round trip.
+    Results are dicts with a "valid" flag and a list of diagnostics, each with a "code", an optional "section"
+    and a human readable "message".
     """
-    def __init__(self):
-        pass
+    SECTIONS = ("Task", "Information", "Analysis", "Insight", "Action", "Sources")
+    # section headers as models write them: "Task:", "**Insights:**", "## Action:", "[Information]:", "\Sources:", "SourceLinks:".
+    # List items such as "1. Information: ..." or "- Action: ..." are content of the current section
+    HEADER = re.compile(
+        r"^[ \t#*_\\\[]*(tasks?|information|analysis|insights?|actions?|sources?|source ?links)[\]*_ \t]*:",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    URL = re.compile(r"https?://[^\s<>\"'\]\[)(,]+")
+    WORD = re.compile(r"\S+")
+
+    def __init__(self, max_words=500, min_section_words=1, max_task_words=300):
+        """
+        Args:
+            max_words (int): Length limit of a report
+            min_section_words (int): Sections with fewer words count as empty
+            max_task_words (int): Length limit of a subtask sent to a Worker
+        """
+        self.max_words = max_words
+        self.min_section_words = min_section_words
+        self.max_task_words = max_task_words
+
+    @classmethod
+    def section_name(cls, header):
+        header = header.lower().replace(" ", "")
+        if header.startswith("source"):
+            return "Sources"
+        return next(section for section in cls.SECTIONS if header.startswith(section.lower()))
+
+    def split_sections(self, report):
+        """Return the sections of a report as a list of (section, text) pairs, in the order they appear"""
+        headers = list(self.HEADER.finditer(report))
+        return [(self.section_name(match.group(1)), report[match.end():headers[i + 1].start() if i + 1 < len(headers) else len(report)].strip(" \t\r\n*_"))
+                for i, match in enumerate(headers)]
 
     def validate_input(self, input_message):
-        # Implement a method to validate that the input message follows the protocol
-        pass
+        """Validate a subtask before it is sent to a Worker
+
+        Args:
+            input_message (str): The subtask
+
+        Returns:
+            dict: {"valid", "diagnostics"}
+        """
+        diagnostics = []
+        n_words = len(self.WORD.findall(input_message or ""))
+        if n_words == 0:
+            diagnostics.append({"code": "empty_task", "message": "The task is empty."})
+        elif n_words > self.max_task_words:
+            diagnostics.append({"code": "too_long", "message": f"The task has {n_words} words, the limit is {self.max_task_words}."})
+        return {"valid": not diagnostics, "diagnostics": diagnostics}
+
+    def validate_output(self, output_message, source_urls=None):
+        """Validate the structure of a Worker's IAIA report
+
+        Args:
+            output_message (str): The protocol report
+            source_urls (list[str]): Links of the pages the report is based on, source links are not checked if None
+
+        Returns:
+            dict: {"valid", "diagnostics", "sections", "sources", "n_words"}
+        """
+        diagnostics = []
+        sections = self.split_sections(output_message)
+        found = [section for section, _ in sections]
+        texts = {}
+        for section, text in sections:
+            if section in texts:
+                diagnostics.append({"code": "duplicate_section", "section": section, "message": f"The {section} section appears more than once."})
+            texts[section] = texts[section] + "\n" + text if section in texts else text
+
+        for section in self.SECTIONS:
+            if section not in texts:
+                diagnostics.append({"code": "missing_section", "section": section, "message": f"The {section} section is missing."})
+            elif section != "Sources" and len(self.WORD.findall(texts[section])) < self.min_section_words:
+                diagnostics.append({"code": "empty_section", "section": section, "message": f"The {section} section is empty."})
+
+        # the first occurrences must follow the protocol order
+        first_seen = [section for i, section in enumerate(found) if section not in found[:i]]
+        if first_seen != [section for section in self.SECTIONS if section in first_seen]:
+            diagnostics.append({"code": "wrong_order", "message": f"The sections are in the order {', '.join(first_seen)}, expected {', '.join(self.SECTIONS)}."})
+
+        n_words = len(self.WORD.findall(output_message))
+        if n_words > self.max_words:
+            diagnostics.append({"code": "too_long", "message": f"The report has {n_words} words, the limit is {self.max_words}."})
+
+        sources = [url.rstrip(".;:") for url in self.URL.findall(texts.get("Sources", ""))]
+        if "Sources" in texts and not sources:
+            diagnostics.append({"code": "no_sources", "section": "Sources", "message": "The Sources section contains no links."})
+        if source_urls is not None:
+            known = {canonicalize_url(url) for url in source_urls}
+            for url in sources:
+                if canonicalize_url(url) not in known:
+                    diagnostics.append({"code": "unknown_source", "section": "Sources", "message": f"The link {url} is not one of the provided sources."})
+
+        return {"valid": not diagnostics, "diagnostics": diagnostics, "sections": texts, "sources": sources, "n_words": n_words}
 
-    def validate_output(self, output_message):
-        # Implement a method to validate that the output message follows the protocol
-        pass
+    @staticmethod
+    def describe(result):
+        """Format the diagnostics of a validation result as a list of problems"""
+        return "\n".join(f"- {diagnostic['message']}" for diagnostic in result["diagnostics"])
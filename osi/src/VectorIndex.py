@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import time
+import zlib
+import threading
+from osi.src.utils import cache_path
+
+class HashingEmbedder:
+    """Embeds short texts offline by hashing their words and word pairs into a fixed number of dimensions.
+
+    Word order mostly does not matter and plural endings are stripped, so rewordings such as "growth rate of the
+    X industry" and "X industry growth rate" land close together. Hashes are CRC32, stable across processes, so
+    persisted vectors stay valid. Any object with a dim attribute and an embed(texts) method returning unit-length
+    rows can replace it, e.g. one calling an embeddings API.
+    """
+    WORD = re.compile(r"\w+")
+    STOPWORDS = frozenset(("a", "an", "the", "of", "in", "on", "for", "and", "or", "to", "with", "by", "at", "from",
+                           "is", "are", "what", "how", "which", "its", "their", "about", "into"))
+
+    def __init__(self, dim=1024, bigram_weight=0.5):
+        """
+        Args:
+            dim (int): Number of dimensions
+            bigram_weight (float): Weight of word pairs relative to single words
+        """
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+        self.name = f"hashing-{dim}-{bigram_weight}"
+
+    def features(self, text):
+        words = [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+                 for word in self.WORD.findall(text.lower()) if word not in self.STOPWORDS]
+        return [(word, 1.0) for word in words] + [(f"{a} {b}", self.bigram_weight) for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        """Return a float32 array with one unit-length row per text"""
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # the bit above the bucket decides the sign, so colliding features tend to cancel out
+                vectors[row, h % self.dim] += weight if (h // self.dim) & 1 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """Cosine similarity search over texts with a JSON payload each, persisted to a directory.
+
+    The vectors live in a vectors.npy that is memory-mapped, so opening a large index reads nothing up front and
+    adding an entry writes one row. The file starts with initial_capacity rows and doubles when it is full, up to
+    max_entries. The texts, payloads and timestamps are appended to entries.jsonl. Entries older than max_age are
+    evicted, and when the index is full the oldest tenth is dropped; both rewrite the two files. Searches are a
+    single matrix-vector product over all rows.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, embedder=None, max_entries=10000, max_age=90*24*3600, initial_capacity=64):
+        """
+        Args:
+            path (str): Directory of the index, in memory only if None
+            embedder (HashingEmbedder): Turns texts into unit-length vectors, a HashingEmbedder if None
+            max_entries (int): Capacity, the oldest entries are evicted beyond it
+            max_age (float): Seconds after which an entry is evicted
+            initial_capacity (int): Rows allocated up front, doubled whenever they are used up
+        """
+        import numpy as np
+
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.initial_capacity = min(initial_capacity, max_entries)
+        self._lock = threading.Lock()
+        self._entries = []
+        self._created = np.zeros(0)
+        self._vectors = None
+        self._stats = {"searches": 0, "hits": 0, "adds": 0, "evictions": 0}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+        if self._vectors is None:
+            self._vectors = self._allocate(self.initial_capacity)
+        self.evict()
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide index persisted to $OSI_CACHE_DIR/vector_index, creating it on first use"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(path=cache_path("vector_index"))
+        return cls._shared
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _allocate(self, rows, path=None):
+        import numpy as np
+
+        shape = (rows, self.embedder.dim)
+        if path is None:
+            return np.zeros(shape, dtype=np.float32)
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+
+    def _capacity(self, n):
+        """Rows to allocate for n entries, initial_capacity doubled as often as needed, at most max_entries"""
+        capacity = max(self.initial_capacity, 1)
+        while capacity < n:
+            capacity *= 2
+        return min(capacity, self.max_entries)
+
+    def _resize(self, n_rows, rows=None):
+        """Replace the vectors by n_rows rows holding the given rows of the current ones, the first n if None"""
+        import numpy as np
+
+        n = len(self._entries)
+        if self.path is None:
+            vectors = self._allocate(n_rows)
+            vectors[:n] = self._vectors[:n] if rows is None else self._vectors[rows]
+            self._vectors = vectors
+            return
+        # write new files and swap them in
+        vectors = self._allocate(n_rows, self._file("vectors.npy.tmp"))
+        vectors[:n] = self._vectors[:n] if rows is None else self._vectors[rows]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(self._file("vectors.npy.tmp"), self._file("vectors.npy"))
+        self._vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+
+    def _load(self):
+        import numpy as np
+
+        vectors_path, entries_path = self._file("vectors.npy"), self._file("entries.jsonl")
+        if not os.path.exists(vectors_path) or not os.path.exists(entries_path):
+            self._vectors = self._allocate(self.initial_capacity, vectors_path)
+            self._write_entries([])
+            return
+        vectors = np.load(vectors_path, mmap_mode="r+")
+        entries = []
+        with open(entries_path, encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a line cut short by a crash
+                    break
+        if (header.get("embedder") != self.embedder.name or vectors.shape[1] != self.embedder.dim
+                or not len(entries) <= len(vectors) <= self.max_entries):
+            # vectors of another embedder or a larger capacity, embed the stored texts again
+            del vectors
+            entries = entries[-self.max_entries:]
+            self._vectors = self._allocate(self._capacity(len(entries)), vectors_path)
+            if entries:
+                self._vectors[:len(entries)] = self.embedder.embed([entry["text"] for entry in entries])
+            self._write_entries(entries)
+        else:
+            self._vectors = vectors
+        self._entries = entries
+        self._created = np.array([entry["created_at"] for entry in entries], dtype=float)
+
+    def _write_entries(self, entries):
+        tmp_path = self._file("entries.jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"embedder": self.embedder.name, "dim": self.embedder.dim}) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._file("entries.jsonl"))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, text, payload=None):
+        """Add a text with a JSON-serializable payload
+
+        Args:
+            text (str): Text the entry is found by, e.g. a subtask
+            payload (dict): Data stored with it, e.g. the report
+        """
+        import numpy as np
+
+        vector = self.embedder.embed([text])[0]
+        entry = {"text": text, "payload": payload, "created_at": time.time()}
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict(keep=int(self.max_entries * 0.9))
+            row = len(self._entries)
+            if row >= len(self._vectors):
+                self._resize(self._capacity(row + 1))
+            self._vectors[row] = vector
+            self._entries.append(entry)
+            self._created = np.append(self._created, entry["created_at"])
+            self._stats["adds"] += 1
+            if self.path is not None:
+                self._vectors.flush()
+                with open(self._file("entries.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def search(self, text, k=1, min_score=0.0, max_age=None):
+        """Find the entries most similar to a text
+
+        Args:
+            text (str): Query text
+            k (int): Maximum number of results
+            min_score (float): Minimum cosine similarity
+            max_age (float): Only entries younger than this many seconds, all if None
+
+        Returns:
+            list[tuple(float, dict)]: (similarity, entry) pairs, most similar first. Entries have the keys
+                "text", "payload" and "created_at"
+        """
+        import numpy as np
+
+        query = self.embedder.embed([text])[0]
+        with self._lock:
+            self._stats["searches"] += 1
+            n = len(self._entries)
+            if n == 0:
+                return []
+            scores = np.asarray(self._vectors[:n] @ query)
+            valid = scores >= min_score
+            if max_age is not None:
+                valid &= self._created >= time.time() - max_age
+            candidates = np.flatnonzero(valid)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            results = [(float(scores[i]), self._entries[i]) for i in candidates[np.argsort(-scores[candidates])]]
+            if results:
+                self._stats["hits"] += 1
+        return results
+
+    def evict(self):
+        """Drop the entries older than max_age"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self, keep=None):
+        import numpy as np
+
+        keep_rows = np.flatnonzero(self._created >= time.time() - self.max_age)
+        if keep is not None:
+            # the newest entries are appended last
+            keep_rows = keep_rows[-keep:] if keep > 0 else keep_rows[:0]
+        if len(keep_rows) == len(self._entries):
+            return
+        self._stats["evictions"] += len(self._entries) - len(keep_rows)
+        self._entries = [self._entries[i] for i in keep_rows]
+        self._created = self._created[keep_rows]
+        if self.path is None:
+            self._vectors[:len(keep_rows)] = self._vectors[keep_rows]
+            return
+        # compact into new files of the same capacity
+        self._resize(len(self._vectors), keep_rows)
+        self._write_entries(self._entries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
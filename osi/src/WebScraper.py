@@ -1,14 +1,50 @@
-import requests
 import os
-from bs4 import BeautifulSoup
-from googlesearch import search
+import codecs
+import contextlib
+import concurrent.futures
 import time
-from tqdm import tqdm
+import random
+from osi.src.HttpClient import HttpClient
+from osi.src.TextExtractor import TextExtractor
+from osi.src.Tracer import Tracer, current_span, traced
+from osi.src.utils import to_thread
 
 class WebScraper:
     """WebScraper class to scrape text from a given serch query"""
-    def __init__(self, engine="google"):
+    BING_MAX_ATTEMPTS = 3
+    ACCEPTED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, engine="google", http_client=None, page_cache=None, search_cache=None, inflight=None,
+                 streaming=True, max_bytes=2*1024*1024, max_chars=20000, extractor=None,
+                 parse_pool=None, tracer=None):
+        """
+        Args:
+            engine (str): "google" or "bing"
+            http_client (HttpClient): Client used for all requests, the process-wide client if None
+            page_cache (PageCache): Cache for the extracted page text
+            search_cache (SearchCache): Cache for search results
+            inflight (threading.Semaphore): Cap on requests in flight
+            streaming (bool): Download pages in chunks and stop once max_chars of text are collected
+            max_bytes (int): Pages larger than this are skipped (or cut off when streaming)
+            max_chars (int): Amount of paragraph text after which a streaming download stops
+            extractor (TextExtractor): Html text extractor, the fastest backend in main content mode if None
+            parse_pool (ParsePool): Process pool the html parsing is offloaded to, parsed in the calling thread if None
+            tracer (Tracer): Records a span per search and page, the process-wide tracer if None
+        """
         self.engine = engine
+        self.streaming = streaming
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.extractor = extractor or TextExtractor(main_content=True)
+        self.parse_pool = parse_pool
+        # all scrapers share one pooled client unless a dedicated one is passed
+        self.http = http_client or HttpClient.shared()
+        # optional semaphore capping the number of requests in flight, may be shared between scrapers
+        self.inflight = inflight or contextlib.nullcontext()
+        self.page_cache = page_cache
+        self.search_cache = search_cache
+        self.tracer = tracer or Tracer.shared()
 
         self.METHODS = {
             "google": self.google_search,
@@ -22,16 +58,125 @@ class WebScraper:
             self.bing_subscription_key = os.environ['BING_SEARCH_V7_SUBSCRIPTION_KEY']
             self.bing_endpoint = os.environ['BING_SEARCH_V7_ENDPOINT'] + "v7.0/search"
 
+    @traced("scrape")
     def scrape(self, url):
-        """Scrape text from a given url"""
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            text = " ".join([p.get_text() for p in soup.find_all("p")])
-            return text
-        else:
-            return None
-        
+        """Scrape text from a given url, using the page cache if one is configured"""
+        span = current_span()
+        span.set(url=url)
+        entry = None
+        headers = {}
+        if self.page_cache is not None:
+            entry = self.page_cache.get(url)
+            if entry is not None and entry["fresh"]:
+                span.add("cache_hits")
+                return entry["text"]
+            headers = self.page_cache.conditional_headers(entry)
+
+        with self.inflight:
+            response = self.http.get(url, headers=headers, stream=True)
+            try:
+                if response.status_code == 304 and entry is not None:
+                    self.page_cache.revalidated(url)
+                    span.add("cache_hits")
+                    return entry["text"]
+                if response.status_code != 200 or not self.is_acceptable(response):
+                    return None
+                if self.parse_pool is not None:
+                    text = self.offload_text(response)
+                elif self.streaming:
+                    text = self.stream_text(response)
+                else:
+                    span.add("bytes", len(response.content))
+                    text = self.extract_text(response.text)
+            finally:
+                response.close()
+
+        if self.page_cache is not None:
+            self.page_cache.put(url, text, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+        return text
+
+    def is_acceptable(self, response):
+        """Check the Content-Type and Content-Length headers before downloading the body"""
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in self.ACCEPTED_CONTENT_TYPES:
+            print(f"Skipping {response.url}: unsupported content type {content_type}")
+            return False
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            print(f"Skipping {response.url}: {content_length} bytes exceed the limit of {self.max_bytes}")
+            return False
+        return True
+
+    def stream_text(self, response):
+        """Read the body in chunks and extract paragraphs incrementally.
+
+        Reading stops once max_chars of text have been collected or max_bytes have been downloaded.
+
+        Args:
+            response (requests.Response): A response opened with stream=True
+
+        Returns:
+            str: The extracted text
+        """
+        content_type = response.headers.get("Content-Type", "").lower()
+        decoder = codecs.getincrementaldecoder(self.response_encoding(response))(errors="replace")
+
+        if content_type.startswith("text/plain"):
+            parts, n_chars, n_bytes = [], 0, 0
+            for chunk in self.iter_body(response):
+                n_bytes += len(chunk)
+                parts.append(decoder.decode(chunk))
+                n_chars += len(parts[-1])
+                if n_chars >= self.max_chars or n_bytes >= self.max_bytes:
+                    break
+            return "".join(parts)[:self.max_chars]
+
+        parser = self.extractor.parser()
+        n_bytes = 0
+        for chunk in self.iter_body(response):
+            n_bytes += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.n_chars >= self.max_chars or n_bytes >= self.max_bytes:
+                break
+        parser.close()
+        return parser.text[:self.max_chars]
+
+    def offload_text(self, response):
+        """Download the body, up to max_bytes, and extract its text on the parse pool
+
+        Only the raw bytes go to the parse process and only the extracted text comes back.
+        """
+        if response.headers.get("Content-Type", "").lower().startswith("text/plain"):
+            return self.stream_text(response)
+        chunks, n_bytes = [], 0
+        for chunk in self.iter_body(response):
+            chunks.append(chunk)
+            n_bytes += len(chunk)
+            if n_bytes >= self.max_bytes:
+                break
+        return self.parse_pool.extract(b"".join(chunks), self.response_encoding(response), self.extractor, self.max_chars)
+
+    def iter_body(self, response):
+        """Iterate over the body of a streamed response in chunks, counting the bytes in the current span"""
+        span = current_span()
+        for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+            span.add("bytes", len(chunk))
+            yield chunk
+
+    @staticmethod
+    def response_encoding(response):
+        """Charset of the response, UTF-8 unless the server declares one"""
+        encoding = (response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else None) or "utf-8"
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            return "utf-8"
+        return encoding
+
+    def extract_text(self, html):
+        """Extract the paragraph text from an html document"""
+        return self.extractor.extract(html, max_chars=self.max_chars)
+
     def bing_search(self, query, num_results=5):
         """Return a list of urls from a bing search"""
         # Construct a request
@@ -39,35 +184,32 @@ class WebScraper:
         params = { 'q': query, 'mkt': mkt }
         headers = { 'Ocp-Apim-Subscription-Key': self.bing_subscription_key }
 
-        # Call the API
-        response = requests.get(self.bing_endpoint, headers=headers, params=params)
-        response.raise_for_status()
-        search_results = response.json()
-        counter = 0
-        while "webPages" not in search_results:
-            if counter > 10:
-                break
-            response = requests.get(self.bing_endpoint, headers=headers, params=params)
+        # Call the API, the endpoint sometimes answers without webPages, retry a few times with jittered backoff
+        for attempt in range(self.BING_MAX_ATTEMPTS):
+            with self.inflight:
+                response = self.http.get(self.bing_endpoint, headers=headers, params=params)
             response.raise_for_status()
-            time.sleep(2)
             search_results = response.json()
-            print(f"Retrying the search...")
-            counter += 1
-        
-        try:
-            search_results = response.json()["webPages"]["value"]
-            return [search_result["url"] for search_result in search_results[:num_results]]
+            if "webPages" in search_results:
+                break
+            if attempt < self.BING_MAX_ATTEMPTS - 1:
+                print(f"Retrying the search...")
+                time.sleep(random.uniform(0.5, 1.0) * 2 ** attempt)
+        else:
+            return []
 
-        except Exception as ex:
-            raise ex
+        search_results = search_results["webPages"]["value"]
+        return [search_result["url"] for search_result in search_results[:num_results]]
     
 
     def google_search(self, query, num_results=5):
         """Search google for a given query and return a list of urls"""
+        from googlesearch import search
         urls = []
         try:
-            for url in search(query, num_results=num_results):
-                urls.append(url)
+            with self.inflight:
+                for url in search(query, num_results=num_results):
+                    urls.append(url)
         except Exception as e:
             print(f"Error while searching: {e}")
 
@@ -76,23 +218,57 @@ class WebScraper:
         return urls
     
 
+    @traced("internet_search")
     def internet_search(self, query, num_results=5):
         """Search the internet for a given query and return a list of urls"""
+        span = current_span()
+        span.set(query=query, engine=self.engine)
+        if self.search_cache is not None:
+            searched = []
+
+            def search():
+                searched.append(True)
+                return self.METHODS[self.engine](query, num_results=num_results)
+
+            urls = self.search_cache.get_or_search(self.engine, query, num_results, search)
+            if not searched:
+                span.add("cache_hits")
+            return urls
         return self.METHODS[self.engine](query, num_results=num_results)
 
-    def perform_search(self, search_query, n_top=1):
-        page_texts = []
-        links = []
-        
+    def perform_search(self, search_query, n_top=1, max_workers=4):
+        """Search the internet and scrape the result pages concurrently
+
+        Args:
+            search_query (str): Search query
+            n_top (int): Number of top results to consider (n_top+3 urls are fetched)
+            max_workers (int): Number of pages downloaded at the same time
+
+        Yields:
+            tuple(str, str): page text and link of every page that could be scraped, as the downloads finish
+        """
+        from tqdm import tqdm
+
         search_urls = self.internet_search(search_query, num_results=n_top+3)
-        for _, url in tqdm(enumerate(search_urls)):
-            try:
-                page_text = self.scrape(url)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {executor.submit(self.scrape, url): url for url in search_urls}
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+                try:
+                    page_text = future.result()
+                except Exception as e:
+                    print(f"Error while scraping: {e}")
+                    continue
                 if page_text:
-                    page_texts.append(page_text)
-                    links.append(url)
-            except Exception as e:
-                print(f"Error while scraping: {e}")
-                continue
+                    yield page_text, futures[future]
+        finally:
+            # the consumer may stop early, do not start the remaining downloads
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def ascrape(self, url):
+        """Async version of scrape, the download and parsing run in a worker thread"""
+        return await to_thread(self.scrape, url)
 
-        return page_texts, links
+    async def ainternet_search(self, query, num_results=5):
+        """Async version of internet_search"""
+        return await to_thread(self.internet_search, query, num_results=num_results)
@@ -0,0 +1,129 @@
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+import concurrent.futures
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code.
+
+    Uses ``asyncio.run`` when no event loop is running in the current thread. When called from inside a running
+    loop (e.g. a Jupyter notebook), the coroutine is executed on a fresh loop in a helper thread instead.
+
+    Args:
+        coroutine (Coroutine): Coroutine to run
+
+    Returns:
+        Any: The result of the coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def cache_path(name):
+    """Return the path of a file or directory in the cache directory, creating the cache directory if needed.
+
+    The cache directory is $OSI_CACHE_DIR, ~/.cache/osi by default.
+
+    Args:
+        name (str): File or directory name, e.g. "pages.sqlite"
+
+    Returns:
+        str: The path
+    """
+    cache_dir = os.getenv("OSI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "osi"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, name)
+
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+
+def io_executor():
+    """Return the process-wide thread pool for blocking calls made from coroutines.
+
+    Its size is read from OSI_IO_THREADS. The pool is shared by all event loops of the process and outlives them.
+    """
+    global _io_executor
+    if _io_executor is None:
+        with _io_executor_lock:
+            if _io_executor is None:
+                _io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.getenv("OSI_IO_THREADS", 64)),
+                                                                     thread_name_prefix="osi-io")
+    return _io_executor
+
+
+async def to_thread(func, /, *args, **kwargs):
+    """Run a blocking function in io_executor, like asyncio.to_thread.
+
+    asyncio.run waits for the loop's default executor when it finishes, so a download whose coroutine has been
+    cancelled would still hold up the caller until it completes. Calls on io_executor that are no longer awaited
+    finish in the background instead.
+
+    Args:
+        func (Callable): Blocking function
+        *args: Positional arguments of func
+        **kwargs: Keyword arguments of func
+
+    Returns:
+        Any: The result of func
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def normalize_url(url):
+    """Normalize a url so equivalent spellings map to the same cache key.
+
+    Lowercases the scheme and host, drops default ports, empty paths and fragments, and sorts the query parameters.
+
+    Args:
+        url (str): Url to normalize
+
+    Returns:
+        str: normalized url
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+TRACKING_PARAMETERS = {"gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_gl",
+                       "ref", "ref_src", "spm", "cmpid", "ocid", "sr_share"}
+
+
+def canonicalize_url(url):
+    """Reduce a url to a canonical form for duplicate detection.
+
+    On top of normalize_url, treats http and https as the same, drops a leading "www." and a trailing slash, and
+    strips utm_* and other tracking parameters that do not change the content of the page.
+
+    Args:
+        url (str): Url to canonicalize
+
+    Returns:
+        str: canonical url
+    """
+    parts = urlsplit(normalize_url(url))
+    scheme = "https" if parts.scheme == "http" else parts.scheme
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    path = parts.path.rstrip("/") or "/"
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMETERS]
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the package as osi.src..., like the benchmarks, without installing it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
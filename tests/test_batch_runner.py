@@ -0,0 +1,52 @@
+import types
+
+from osi.src.BatchRunner import BatchRunner
+from osi.src.TaskState import TaskState
+
+
+class FakeOrchestrator:
+    def __init__(self, n_workers=2):
+        self.workers = [object() for _ in range(n_workers)]
+        self.openai = types.SimpleNamespace(usage=lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        self.runner = None
+        self.combined = []
+
+    def create_tasks(self, topic):
+        return [f"{topic} {i}" for i in range(3)]
+
+    def run_task(self, worker, state, task_timeout=None):
+        state.start()
+        state.add_tokens(10)
+        state.finish(TaskState.DONE, result=f"report of {state.task}")
+
+    def combine_results(self, topic, reports):
+        self.combined.append(topic)
+        return f"final report of {topic}"
+
+
+def test_iter_results_combines_every_topic():
+    orchestrator = FakeOrchestrator()
+    records = list(BatchRunner(orchestrator).iter_results(["a", "b", ""]))
+    assert sorted(record["topic"] for record in records) == ["a", "b"]
+    for record in records:
+        assert record["status"] == "done"
+        assert record["report"] == f"final report of {record['topic']}"
+        assert len(record["reports"]) == 3
+        assert record["tokens"] == 30
+
+
+def test_cancelled_topics_are_not_combined():
+    orchestrator = FakeOrchestrator(n_workers=1)
+    runner = BatchRunner(orchestrator)
+
+    def run_task(worker, state, task_timeout=None):
+        FakeOrchestrator.run_task(orchestrator, worker, state, task_timeout)
+        runner.cancel()
+
+    orchestrator.run_task = run_task
+    records = list(runner.iter_results(["a"]))
+    assert [record["status"] for record in records] == [TaskState.CANCELLED]
+    assert records[0]["report"] is None
+    assert list(records[0]["reports"]) == ["a 0"]
+    assert orchestrator.combined == []
+    assert runner.stats()["topics_cancelled"] == 1
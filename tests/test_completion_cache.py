@@ -0,0 +1,73 @@
+import pytest
+
+from osi.src.CompletionCache import CompletionCache
+
+
+def key(text, temperature=0.0):
+    return CompletionCache.key("gpt-3.5-turbo", [{"role": "user", "content": text}], 100, temperature, None)
+
+
+def test_key_depends_on_every_request_parameter():
+    assert key("a") == key("a")
+    assert key("a") != key("b")
+    assert key("a") != key("a", temperature=0.2)
+
+
+def test_memory_tier_hits_and_misses():
+    cache = CompletionCache()
+    assert cache.get(key("a")) is None
+    cache.put(key("a"), "answer", tokens=42)
+    assert cache.get(key("a")) == "answer"
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["tokens_saved"]) == (1, 1, 42)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_entries_expire():
+    cache = CompletionCache()
+    cache.put(key("a"), "stale", ttl=-1)
+    assert cache.get(key("a")) is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = CompletionCache(max_memory_entries=2)
+    cache.put(key("a"), "a")
+    cache.put(key("b"), "b")
+    cache.get(key("a"))
+    cache.put(key("c"), "c")
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) == "a"
+    assert cache.get(key("c")) == "c"
+
+
+def test_disk_tier_survives_the_process(tmp_path):
+    path = str(tmp_path / "completions.sqlite")
+    CompletionCache(path=path).put(key("a"), "answer", tokens=7)
+    cache = CompletionCache(path=path)
+    assert cache.get(key("a")) == "answer"
+    assert cache.get(key("a")) == "answer"
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_sampled_completions_are_not_cached_by_default():
+    cache = CompletionCache()
+    assert cache.is_cacheable(0.0)
+    assert cache.is_cacheable(CompletionCache.DEFAULT_MAX_TEMPERATURE)
+    assert not cache.is_cacheable(0.7)
+    assert CompletionCache(max_temperature=None).is_cacheable(0.7)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, CompletionCache.DEFAULT_MAX_TEMPERATURE),
+    ("", CompletionCache.DEFAULT_MAX_TEMPERATURE),
+    ("0.8", 0.8),
+    ("none", None),
+    ("None", None),
+])
+def test_max_temperature_from_env(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("OSI_COMPLETION_MAX_TEMPERATURE", raising=False)
+    else:
+        monkeypatch.setenv("OSI_COMPLETION_MAX_TEMPERATURE", value)
+    assert CompletionCache.max_temperature_from_env() == expected
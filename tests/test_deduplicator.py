@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from osi.src.Deduplicator import Deduplicator
+
+def article(seed, n_words=400):
+    rng = random.Random(seed)
+    return " ".join(f"word{rng.randrange(2000)}" for _ in range(n_words))
+
+
+ARTICLE = article(0)
+
+
+def test_canonical_urls_are_claimed_once():
+    deduplicator = Deduplicator()
+    assert deduplicator.claim_url("https://www.example.com/article/?utm_source=news")
+    # claimed while the first copy is fetched
+    assert not deduplicator.claim_url("http://example.com/article")
+    deduplicator.commit("https://www.example.com/article/?utm_source=news")
+    assert not deduplicator.claim_url("https://example.com/article")
+    assert deduplicator.claim_url("https://example.com/other")
+    assert deduplicator.stats()["url_duplicates"] == 2
+
+
+def test_released_urls_can_be_claimed_again():
+    deduplicator = Deduplicator()
+    assert deduplicator.claim_url("https://example.com/a")
+    deduplicator.release("https://example.com/a")
+    assert deduplicator.claim_url("https://example.com/a")
+
+
+def test_near_duplicate_pages_are_detected_after_commit():
+    deduplicator = Deduplicator()
+    deduplicator.claim_url("https://a.com/story")
+    assert deduplicator.claim_content(ARTICLE, "https://a.com/story") is None
+
+    # syndicated copy with other formatting, checked while the original is still being summarized
+    copy = ARTICLE.upper().replace(" ", "\n")
+    deduplicator.claim_url("https://b.com/story")
+    assert deduplicator.claim_content(copy, "https://b.com/story") is None
+
+    deduplicator.commit("https://a.com/story")
+    deduplicator.claim_url("https://c.com/story")
+    assert deduplicator.claim_content(copy, "https://c.com/story") == "https://a.com/story"
+    assert deduplicator.stats() == {"urls": 1, "url_duplicates": 0, "pages": 1, "content_duplicates": 1}
+
+
+def test_different_pages_are_not_duplicates():
+    deduplicator = Deduplicator()
+    deduplicator.claim_url("https://a.com/story")
+    deduplicator.claim_content(ARTICLE, "https://a.com/story")
+    deduplicator.commit("https://a.com/story")
+    other = article(1)
+    deduplicator.claim_url("https://b.com/other")
+    assert deduplicator.claim_content(other, "https://b.com/other") is None
+
+
+def test_released_pages_do_not_block_their_duplicates():
+    deduplicator = Deduplicator()
+    deduplicator.claim_url("https://a.com/story")
+    deduplicator.claim_content(ARTICLE, "https://a.com/story")
+    deduplicator.release("https://a.com/story")
+    deduplicator.claim_url("https://b.com/story")
+    assert deduplicator.claim_content(ARTICLE, "https://b.com/story") is None
+
+
+def test_bands_must_outnumber_the_distance():
+    with pytest.raises(ValueError):
+        Deduplicator(max_distance=4, n_bands=4)
@@ -0,0 +1,56 @@
+import time
+import threading
+
+from osi.src.Orchestrator import Orchestrator
+from osi.src.TaskState import TaskState
+
+
+def fake_run_task(calls, delays=None):
+    lock = threading.Lock()
+
+    def run_task(worker, state, task_timeout=None):
+        with lock:
+            calls.append((worker, state.task))
+        state.start()
+        time.sleep((delays or {}).get(state.task, 0.0))
+        if state.cancelled:
+            state.finish(TaskState.CANCELLED)
+        else:
+            state.finish(TaskState.DONE, result=f"report of {state.task}")
+
+    return run_task
+
+
+def test_iter_work_runs_repeated_tasks_once_and_yields_in_completion_order(monkeypatch):
+    orchestrator = Orchestrator(3, use_cache=False)
+    calls = []
+    monkeypatch.setattr(orchestrator, "run_task", fake_run_task(calls, delays={"slow": 0.3, "medium": 0.15}))
+    states = list(orchestrator.iter_work(["slow", "medium", "fast", "fast", "slow"]))
+    assert [state.task for state in states] == ["fast", "medium", "slow"]
+    assert all(state.result == f"report of {state.task}" for state in states)
+    assert sorted(task for _, task in calls) == ["fast", "medium", "slow"]
+    # all three ran at the same time, each on its own worker
+    assert {worker for worker, _ in calls} == set(orchestrator.workers)
+
+
+def test_iter_work_keeps_every_worker_busy(monkeypatch):
+    orchestrator = Orchestrator(2, use_cache=False)
+    calls = []
+    tasks = [f"task {i}" for i in range(8)]
+    monkeypatch.setattr(orchestrator, "run_task", fake_run_task(calls, delays=dict.fromkeys(tasks, 0.1)))
+    start = time.monotonic()
+    assert len(list(orchestrator.iter_work(tasks, queue_size=1))) == 8
+    assert time.monotonic() - start < 0.7
+    assert len(calls) == 8
+
+
+def test_stopping_iter_work_early_cancels_the_remaining_tasks(monkeypatch):
+    orchestrator = Orchestrator(1, use_cache=False)
+    calls = []
+    tasks = [f"task {i}" for i in range(10)]
+    monkeypatch.setattr(orchestrator, "run_task", fake_run_task(calls, delays=dict.fromkeys(tasks, 0.05)))
+    for state in orchestrator.iter_work(tasks, queue_size=1):
+        break
+    assert orchestrator.cancel_event.is_set()
+    assert len(calls) < len(tasks)
+    assert all(state.status in (TaskState.DONE, TaskState.CANCELLED) for state in orchestrator.task_states.values())
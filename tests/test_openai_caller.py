@@ -0,0 +1,41 @@
+import types
+
+import openai
+import pytest
+
+from osi.src.OpenAICaller import OpenAICaller
+from osi.src.RateLimiter import RateLimiter
+
+
+def fake_api(monkeypatch, errors):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if errors:
+            raise errors.pop(0)
+        return {"choices": [{"message": {"content": "done"}}],
+                "usage": {"prompt_tokens": 9, "completion_tokens": 1, "total_tokens": 10}}
+
+    api = types.SimpleNamespace(ChatCompletion=types.SimpleNamespace(create=create), error=openai.error)
+    monkeypatch.setattr(OpenAICaller, "client", classmethod(lambda cls: api))
+    limiter = RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**9, server_error_backoff=0.0)
+    return OpenAICaller("gpt-3.5-turbo", rate_limiter=limiter), calls
+
+
+def test_transient_server_errors_are_retried(monkeypatch):
+    errors = [openai.error.APIError("boom", http_status=500), openai.error.ServiceUnavailableError("busy"),
+              openai.error.Timeout("slow")]
+    caller, calls = fake_api(monkeypatch, errors)
+    assert caller.gen_request_to_api([{"role": "user", "content": "hi"}], temperature=0.0) == "done"
+    assert len(calls) == 4
+    assert caller.rate_limiter.stats()["server_errors"] == 3
+    # a server error is not a quota problem, the rate stays untouched
+    assert caller.rate_limiter.stats()["rate_factor"] == 1.0
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    caller, calls = fake_api(monkeypatch, [openai.error.InvalidRequestError("bad request", None)])
+    with pytest.raises(openai.error.InvalidRequestError):
+        caller.gen_request_to_api([{"role": "user", "content": "hi"}], temperature=0.0)
+    assert len(calls) == 1
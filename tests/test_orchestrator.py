@@ -0,0 +1,69 @@
+import asyncio
+
+from osi.src.Orchestrator import Orchestrator
+
+
+def test_aiter_research_closes_the_research_when_the_consumer_stops(monkeypatch):
+    orchestrator = Orchestrator(1, use_cache=False)
+    closed = []
+
+    def iter_research(research_topic, task_timeout=None, run_id=None):
+        try:
+            for i in range(10):
+                yield {"type": "task_report", "task": f"task {i}"}
+        finally:
+            closed.append(research_topic)
+
+    monkeypatch.setattr(orchestrator, "iter_research", iter_research)
+
+    async def consume():
+        async for event in orchestrator.aiter_research("topic"):
+            return event
+
+    assert asyncio.run(consume())["task"] == "task 0"
+    assert closed == ["topic"]
+    assert orchestrator.cancel_event.is_set()
+
+
+def test_aiter_research_waits_for_the_running_step_when_cancelled(monkeypatch):
+    orchestrator = Orchestrator(1, use_cache=False)
+    closed = []
+
+    def iter_research(research_topic, task_timeout=None, run_id=None):
+        try:
+            yield {"type": "tasks_created", "tasks": ["task"]}
+            # a subtask still running when the consumer is cancelled
+            orchestrator.cancel_event.wait(5)
+            yield {"type": "task_report", "task": "task"}
+        finally:
+            closed.append(research_topic)
+
+    monkeypatch.setattr(orchestrator, "iter_research", iter_research)
+
+    async def consume():
+        events = orchestrator.aiter_research("topic")
+        await events.__anext__()
+        task = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return list(closed)
+
+    assert asyncio.run(consume()) == ["topic"]
+
+
+def test_report_index_is_opened_on_first_lookup(monkeypatch, tmp_path):
+    from osi.src.ArtifactStore import ArtifactStore
+    from osi.src.CompletionCache import CompletionCache
+    from osi.src.PageCache import PageCache
+    from osi.src.SearchCache import SearchCache
+    from osi.src.TaskState import TaskState
+    from osi.src.VectorIndex import VectorIndex
+
+    monkeypatch.setenv("OSI_CACHE_DIR", str(tmp_path))
+    for cls in (ArtifactStore, CompletionCache, PageCache, SearchCache, VectorIndex):
+        monkeypatch.setattr(cls, "_shared", None)
+    orchestrator = Orchestrator(1)
+    assert VectorIndex._shared is None
+    assert orchestrator.similar_report(TaskState("task")) is None
+    assert orchestrator.report_index is VectorIndex._shared is not None
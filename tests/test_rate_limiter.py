@@ -0,0 +1,73 @@
+import time
+import threading
+
+from osi.src.RateLimiter import RateLimiter
+
+
+def test_requests_within_budget_do_not_wait():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    start = time.monotonic()
+    for _ in range(10):
+        limiter.acquire(100)
+    assert time.monotonic() - start < 0.1
+    stats = limiter.stats()
+    assert (stats["requests"], stats["tokens"], stats["queued"]) == (10, 1000, 0)
+
+
+def test_token_budget_is_refilled_over_time():
+    # 10 tokens per second
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=600)
+    limiter.acquire(600)
+    start = time.monotonic()
+    limiter.acquire(3)
+    assert 0.2 < time.monotonic() - start < 1.0
+
+
+def test_high_priority_requests_are_served_first():
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=600)
+    limiter.acquire(600)
+    order = []
+
+    def acquire(name, priority):
+        limiter.acquire(3, priority=priority)
+        order.append(name)
+
+    normal = threading.Thread(target=acquire, args=("normal", RateLimiter.PRIORITY_NORMAL))
+    normal.start()
+    time.sleep(0.05)
+    high = threading.Thread(target=acquire, args=("high", RateLimiter.PRIORITY_HIGH))
+    high.start()
+    normal.join(5)
+    high.join(5)
+    assert order == ["high", "normal"]
+
+
+def test_rate_limit_pauses_all_requests_and_lowers_the_rate():
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=60000)
+    limiter.on_rate_limited({"Retry-After": "0.3"})
+    start = time.monotonic()
+    limiter.acquire(1)
+    assert time.monotonic() - start >= 0.25
+    assert limiter.stats()["rate_factor"] == 0.5
+    assert limiter.stats()["rate_limited"] == 1
+    limiter.on_success()
+    assert limiter.stats()["rate_factor"] == 0.55
+
+
+def test_delay_from_headers():
+    assert RateLimiter._delay_from_headers({"retry-after": "2"}) == 2.0
+    assert RateLimiter._delay_from_headers({"x-ratelimit-reset-requests": "20ms", "x-ratelimit-reset-tokens": "1m6s"}) == 66.0
+    assert RateLimiter._delay_from_headers({"retry-after": "soon"}) is None
+    assert RateLimiter._delay_from_headers({}) is None
+
+
+def test_server_errors_back_off_exponentially_without_pausing_other_requests():
+    limiter = RateLimiter(server_error_backoff=0.5, max_backoff=3.0)
+    for attempt, upper in enumerate((0.5, 1.0, 2.0, 3.0, 3.0)):
+        assert upper / 2 <= limiter.on_server_error(attempt) <= upper
+    assert limiter.on_server_error(0, {"Retry-After": "4"}) == 4.0
+    start = time.monotonic()
+    limiter.acquire(1)
+    assert time.monotonic() - start < 0.1
+    assert limiter.stats()["server_errors"] == 6
+    assert limiter.stats()["rate_factor"] == 1.0
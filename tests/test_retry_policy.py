@@ -0,0 +1,55 @@
+import types
+
+from osi.src.CompletionCache import CompletionCache
+from osi.src.OpenAICaller import OpenAICaller
+from osi.src.RateLimiter import RateLimiter
+from osi.src.RetryPolicy import RetryPolicy
+from osi.src.TaskState import TaskState
+from osi.src.Worker import Worker
+
+
+def test_exhausted_after_max_attempts():
+    policy = RetryPolicy(max_attempts=2)
+    state = TaskState("task")
+    state.n_attempts = 1
+    assert policy.exhausted(state) is None
+    state.n_attempts = 2
+    assert policy.exhausted(state) == RetryPolicy.MAX_ATTEMPTS
+
+
+def test_exhausted_by_time_and_tokens():
+    state = TaskState("task")
+    state.n_attempts = 1
+    state.start()
+    state.started_at -= 10
+    assert RetryPolicy(max_seconds=5).exhausted(state) == RetryPolicy.TIME_BUDGET
+    assert RetryPolicy(max_seconds=60).exhausted(state) is None
+    state.add_tokens(1000)
+    assert RetryPolicy(max_tokens=1000).exhausted(state) == RetryPolicy.TOKEN_BUDGET
+    assert RetryPolicy(max_tokens=1001).exhausted(state) is None
+
+
+def test_cached_completions_do_not_count_towards_the_token_budget(monkeypatch):
+    import openai
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return {"choices": [{"message": {"content": "queries"}}],
+                "usage": {"prompt_tokens": 90, "completion_tokens": 10, "total_tokens": 100}}
+
+    api = types.SimpleNamespace(ChatCompletion=types.SimpleNamespace(create=create), error=openai.error)
+    monkeypatch.setattr(OpenAICaller, "client", classmethod(lambda cls: api))
+    caller = OpenAICaller("gpt-3.5-turbo", cache=CompletionCache(), rate_limiter=RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**9))
+    worker = Worker(openai_caller=caller, scraper=object())
+    messages = [{"role": "user", "content": "generate queries"}]
+
+    first, second = TaskState("task"), TaskState("task")
+    assert worker.request(messages, max_tokens=50, temperature=0.0, state=first) == "queries"
+    assert worker.request(messages, max_tokens=50, temperature=0.0, state=second) == "queries"
+    assert len(calls) == 1
+    assert first.tokens_used == 100
+    assert second.tokens_used == 0
+    assert caller.usage() == {"calls": 1, "prompt_tokens": 90, "completion_tokens": 10}
+    assert RetryPolicy(max_tokens=100).exhausted(second) is None
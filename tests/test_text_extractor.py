@@ -0,0 +1,74 @@
+import importlib.util
+
+import pytest
+
+from osi.src.TextExtractor import TextExtractor
+
+BACKENDS = [backend for backend, module in (("lxml", "lxml"), ("html.parser", "html.parser"), ("bs4", "bs4"))
+            if importlib.util.find_spec(module) is not None]
+
+SENTENCE = "The committee reviewed the quarterly results of the renewable energy program"
+
+
+def extract(html, backend, main_content=False):
+    return TextExtractor(backend=backend, main_content=main_content).extract(html)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_paragraph_text(backend):
+    html = f"<html><head><script>var p = '<p>no</p>';</script></head><body><p>{SENTENCE}.</p><p>Second &amp; last.</p></body></html>"
+    assert extract(html, backend) == f"{SENTENCE}. Second & last."
+
+
+@pytest.mark.parametrize("main_content", [False, True])
+def test_unclosed_paragraphs_are_split_the_same_by_every_backend(main_content):
+    html = (f"<body><div class='content'><p>{SENTENCE} one.<p>{SENTENCE} two.<p><a href='/ad'>Buy now, cheap offers today</a>"
+            f"<p>Short text<div><p>{SENTENCE} three.</div><p>{SENTENCE} four.<ul><li>item</ul><h2>Title</h2><p>{SENTENCE} five.</body>")
+    outputs = {backend: extract(html, backend, main_content) for backend in BACKENDS}
+    assert len(set(outputs.values())) == 1, outputs
+    text = outputs[BACKENDS[0]]
+    for n in ("one", "two", "three", "four", "five"):
+        assert f"{SENTENCE} {n}." in text
+    assert ("Buy now" in text) != main_content
+    assert ("Short text" in text) != main_content
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_main_content_drops_boilerplate(backend):
+    html = (f"<body><nav><p>{SENTENCE} in the menu.</p></nav><div id='cookie-banner'><p>{SENTENCE} and cookies.</p></div>"
+            f"<main><p>{SENTENCE}.</p></main><div class='related'><p>{SENTENCE} elsewhere.</p></div>"
+            f"<footer><p>{SENTENCE} in the footer.</p></footer></body>")
+    assert extract(html, backend, main_content=True) == f"{SENTENCE}."
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("wrapper", [
+    "<body class='no-sidebar'>{}</body>",
+    "<body class='home page has-main-navigation'><div id='content'>{}</div></body>",
+    "<html class='menu-open'><body><div class='ad-free'>{}</div></body></html>",
+    "<body><main class='main nav-collapsed'>{}</main></body>",
+])
+def test_main_content_keeps_wrappers_that_mention_boilerplate(backend, wrapper):
+    assert extract(wrapper.format(f"<p>{SENTENCE}.</p>"), backend, main_content=True) == f"{SENTENCE}."
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_main_content_falls_back_to_all_paragraphs(backend):
+    html = "<body><div class='sidebar'><p>Only a sidebar.</p></div><p>Short.</p></body>"
+    assert extract(html, backend, main_content=True) == "Only a sidebar. Short."
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_incremental_feed_and_max_chars(backend):
+    html = f"<body><p>{SENTENCE}.</p><p>{SENTENCE} again.</p></body>"
+    parser = TextExtractor(backend=backend).parser()
+    for i in range(0, len(html), 7):
+        parser.feed(html[i:i + 7])
+    parser.close()
+    assert parser.text == f"{SENTENCE}. {SENTENCE} again."
+    assert TextExtractor(backend=backend).extract(html, max_chars=20) == SENTENCE[:20]
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        TextExtractor(backend="regex")
@@ -0,0 +1,63 @@
+from osi.src.Validator import Validator
+
+REPORT = (
+    "Task: Growth of the solar market\n\n"
+    "Information: Installations grew by 30% in 2023.\n\n"
+    "Analysis: Falling module prices drive demand.\n\n"
+    "Insight: Growth continues while prices fall.\n\n"
+    "Action: Watch module prices.\n\n"
+    "Sources: https://example.com/solar, https://news.example.org/a?id=1\n"
+)
+
+
+def codes(result):
+    return [diagnostic["code"] for diagnostic in result["diagnostics"]]
+
+
+def test_valid_report():
+    result = Validator().validate_output(REPORT, source_urls=["https://example.com/solar", "https://news.example.org/a?id=1"])
+    assert result["valid"], result["diagnostics"]
+    assert result["sources"] == ["https://example.com/solar", "https://news.example.org/a?id=1"]
+    assert result["sections"]["Analysis"] == "Falling module prices drive demand."
+
+
+def test_markdown_headers():
+    report = REPORT.replace("Task:", "## Task:").replace("Information:", "**Information:**").replace("Action:", "[Action]:")
+    assert Validator().validate_output(report)["valid"]
+
+
+def test_list_items_are_not_headers():
+    report = REPORT.replace("Information: Installations grew by 30% in 2023.",
+                            "Information: facts\n1. Information: gathered from site\n- Action: noted by analysts")
+    result = Validator().validate_output(report)
+    assert result["valid"], result["diagnostics"]
+    assert result["sections"]["Information"] == "facts\n1. Information: gathered from site\n- Action: noted by analysts"
+
+
+def test_repeated_section_is_reported_and_joined_with_a_newline():
+    result = Validator().validate_output(REPORT + "Insight: more facts\n")
+    assert codes(result) == ["duplicate_section"]
+    assert result["sections"]["Insight"] == "Growth continues while prices fall.\nmore facts"
+
+
+def test_missing_empty_and_misordered_sections():
+    report = REPORT.replace("Analysis: Falling module prices drive demand.", "Analysis:")
+    assert codes(Validator().validate_output(report)) == ["empty_section"]
+    report = REPORT.replace("Insight: Growth continues while prices fall.\n\n", "")
+    assert codes(Validator().validate_output(report)) == ["missing_section"]
+    task, rest = REPORT.split("\n\n", 1)
+    assert "wrong_order" in codes(Validator().validate_output(rest + "\n" + task))
+
+
+def test_sources():
+    assert codes(Validator().validate_output(REPORT.replace("https://example.com/solar, https://news.example.org/a?id=1", "none"))) == ["no_sources"]
+    result = Validator().validate_output(REPORT, source_urls=["https://example.com/solar?utm_source=x"])
+    assert codes(result) == ["unknown_source"]
+
+
+def test_length_limits():
+    validator = Validator(max_words=20, max_task_words=3)
+    assert "too_long" in codes(validator.validate_output(REPORT))
+    assert codes(validator.validate_input("solar market growth")) == []
+    assert codes(validator.validate_input("solar market growth rate")) == ["too_long"]
+    assert codes(validator.validate_input("  ")) == ["empty_task"]
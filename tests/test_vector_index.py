@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from osi.src.VectorIndex import HashingEmbedder, VectorIndex
+
+
+def test_similar_texts_are_found_first():
+    index = VectorIndex()
+    index.add("growth rate of the keyboard industry", {"report": "keyboards"})
+    index.add("history of the roman empire", {"report": "rome"})
+    score, entry = index.search("keyboard industry growth rates", k=1)[0]
+    assert entry["payload"] == {"report": "keyboards"}
+    assert score > 0.7
+    assert index.search("keyboard industry growth", min_score=0.99) == []
+
+
+def test_vectors_grow_from_the_initial_capacity():
+    index = VectorIndex(embedder=HashingEmbedder(dim=16), initial_capacity=2, max_entries=100)
+    assert index._vectors.shape == (2, 16)
+    for i in range(5):
+        index.add(f"text number {i}")
+    assert index._vectors.shape == (8, 16)
+    assert [entry["text"] for _, entry in index.search("text number 4", k=1)] == ["text number 4"]
+
+
+def test_full_index_evicts_the_oldest_entries():
+    index = VectorIndex(embedder=HashingEmbedder(dim=16), initial_capacity=4, max_entries=10)
+    for i in range(11):
+        index.add(f"entry {i}")
+    assert len(index) == 10
+    assert index._vectors.shape == (10, 16)
+    assert index.stats()["evictions"] == 1
+
+
+def test_persisted_index_is_reopened(tmp_path):
+    path = str(tmp_path / "index")
+    index = VectorIndex(path=path, embedder=HashingEmbedder(dim=16), initial_capacity=2)
+    for i in range(3):
+        index.add(f"subtask {i}", {"i": i})
+    del index
+    assert np.load(os.path.join(path, "vectors.npy"), mmap_mode="r").shape == (4, 16)
+
+    reopened = VectorIndex(path=path, embedder=HashingEmbedder(dim=16), initial_capacity=2)
+    assert len(reopened) == 3
+    assert reopened.search("subtask 2", k=1)[0][1]["payload"] == {"i": 2}
+    reopened.add("subtask 3", {"i": 3})
+    reopened.add("subtask 4", {"i": 4})
+    assert reopened._vectors.shape == (8, 16)
+    assert reopened.search("subtask 4", k=1)[0][1]["payload"] == {"i": 4}
+
+
+def test_vectors_of_another_embedder_are_recomputed(tmp_path):
+    path = str(tmp_path / "index")
+    VectorIndex(path=path, embedder=HashingEmbedder(dim=16)).add("market size of electric cars")
+    index = VectorIndex(path=path, embedder=HashingEmbedder(dim=32))
+    assert index._vectors.shape[1] == 32
+    assert index.search("electric cars market size", k=1)[0][1]["text"] == "market size of electric cars"